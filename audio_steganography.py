@@ -1,87 +1,395 @@
+import io
+import logging
 import wave
-from PIL import Image
+import struct
+from collections import defaultdict
+import numpy as np
+from lsb_utils import validate_lsb_count, embed_groups, group_count, copy_cover, BitReader, STREAM_CHUNK_GROUPS
+import os
+from payload import PayloadSource, unpack_stream, read_until_marker, payload_to_text, usable_bits, PayloadError
+from payload import HEADER, parse_header, open_payload
+from progress import report
+from instrumentation import timed, phase
+from decode_cache import cached_decode
+from scatter import carrier_permutation, scatter_groups
+from buffers import as_file, replacing
 
-def encode_audio_lsb(cover_audio_path, payload_path, output_audio_path, lsb_count=1):
-    try:
-        # Validate the lsb_count value
-        if lsb_count < 1 or lsb_count > 8:
-            raise ValueError("LSB count must be between 1 and 8.")
+# 16-bit terminator ('1111111111111110') of the text-only format used before the payload container
+TERMINATOR = b'\xff\xfe'
 
-        # Open cover audio file in binary read mode
-        with wave.open(cover_audio_path, 'rb') as audio:
-            params = audio.getparams()
-            frames = bytearray(audio.readframes(audio.getnframes()))
+# Number of frames read or written per step, which bounds memory use for long covers
+CHUNK_FRAMES = 1 << 18
+
+logger = logging.getLogger(__name__)
+
+# Keyed decoding keeps every selected low byte of the recording in memory, instead of
+# sorting its reads by block, when it needs at least 1 in DENSE_GATHER_RATIO of them
+DENSE_GATHER_RATIO = 4
+
+# RIFF chunk header (id, size) and the start of the 'fmt ' chunk
+RIFF_CHUNK = struct.Struct('<4sI')
+WAVE_FORMAT = struct.Struct('<HHIIH')
+
+def wav_data_region(wav_path):
+    # (offset, length) of the sample data in a WAV file, found by walking the RIFF chunks.
+    # The length is cut to whole frames and to the end of the file, since some writers
+    # leave the data chunk size at 0 or 0xFFFFFFFF when they cannot seek back to fill it in.
+    file_size = os.path.getsize(wav_path)
+    block_align = None
+    with open(wav_path, 'rb') as file:
+        riff, _ = RIFF_CHUNK.unpack(file.read(RIFF_CHUNK.size))
+        if riff != b'RIFF' or file.read(4) != b'WAVE':
+            raise ValueError("The file is not a WAV audio file.")
+        while True:
+            chunk_header = file.read(RIFF_CHUNK.size)
+            if len(chunk_header) < RIFF_CHUNK.size:
+                raise ValueError("The WAV file has no data chunk.")
+            chunk_id, chunk_size = RIFF_CHUNK.unpack(chunk_header)
+            if chunk_id == b'fmt ':
+                block_align = WAVE_FORMAT.unpack(file.read(WAVE_FORMAT.size))[4]
+                chunk_size -= WAVE_FORMAT.size
+            elif chunk_id == b'data':
+                if not block_align:
+                    raise ValueError("The WAV data chunk comes before its format chunk.")
+                offset = file.tell()
+                length = min(chunk_size, file_size - offset)
+                return offset, length - length % block_align
+            # Chunks are padded to an even size
+            file.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+# The payload goes into the least significant bits of the samples of the selected channels
+# (all of them by default), frame after frame. Samples are little-endian, so those bits
+# are in the first byte of every sample; only that byte is ever changed, whatever the
+# sample width, so 16-bit and 24-bit audio keep their high-order bytes. For 8-bit audio
+# this is every byte of sample data, the same as the layout used before, which embedded
+# in every byte of 16-bit and 24-bit samples too; the decoder still reads that layout.
+
+def sample_channels(params, channels=None):
+    # Sorted channel indices to embed in, every channel by default
+    if channels is None:
+        return list(range(params.nchannels))
+    channels = sorted(set(channels))
+    if not channels or channels[0] < 0 or channels[-1] >= params.nchannels:
+        raise ValueError(f"Audio channels must be between 0 and {params.nchannels - 1}.")
+    return channels
+
+def sample_lsb_bytes(frames, params, channels):
+    # The low byte of every selected sample in a block of whole frames, frame by frame: a
+    # strided view into frames when every channel is selected, otherwise a copy
+    if len(channels) == params.nchannels:
+        return frames[::params.sampwidth]
+    return frames.reshape(-1, params.nchannels, params.sampwidth)[:, channels, 0].reshape(-1)
 
-        # Load the payload text and convert to binary
-        with open(payload_path, 'r') as file:
-            payload = file.read()
+def put_sample_lsb_bytes(frames, params, channels, values):
+    # Store values taken with sample_lsb_bytes back into frames (a view already is)
+    if len(channels) != params.nchannels:
+        frames.reshape(-1, params.nchannels, params.sampwidth)[:, channels, 0] = values.reshape(-1, len(channels))
 
-        binary_payload = ''.join([format(ord(char), '08b') for char in payload])
-        # Append a unique terminator (e.g., 16-bit terminator)
-        binary_payload += '1111111111111110'
+def sample_byte_offsets(indices, params, channels):
+    # Offsets into the sample data of the low bytes of the given carrier values
+    if len(channels) == params.nchannels:
+        return indices * params.sampwidth
+    frame, column = np.divmod(indices, len(channels))
+    return (frame * params.nchannels + np.asarray(channels)[column]) * params.sampwidth
 
-        # Calculate maximum capacity for the payload
-        max_capacity_bits = len(frames) * lsb_count  # lsb_count bits per audio sample
+def split_by_block(offsets, block_bytes, values):
+    # (block number, offsets within the block, matching values) for each block of
+    # block_bytes of sample data the offsets fall in. Sorting small block numbers is a
+    # radix sort, far cheaper than sorting the offsets themselves.
+    blocks, offsets = np.divmod(offsets, block_bytes)
+    offsets = offsets.astype(np.uint32)  # Blocks are far smaller than 4 GiB
+    ends = np.cumsum(np.bincount(blocks))
+    if len(ends) <= 1 << 8:
+        blocks = blocks.astype(np.uint8)
+    elif len(ends) <= 1 << 16:
+        blocks = blocks.astype(np.uint16)
+    order = np.argsort(blocks, kind='stable')
+    offsets = offsets[order]
+    values = values[order]
+    start = 0
+    for block, end in enumerate(ends):
+        if end > start:
+            yield block, offsets[start:end], values[start:end]
+        start = end
+
+def audio_capacity(cover_audio, lsb_count=1, channels=None):
+    # Usable payload bits, from the WAV header only: lsb_count bits in every selected sample
+    validate_lsb_count(lsb_count)
+    with wave.open(as_file(cover_audio), 'rb') as audio:
+        params = audio.getparams()
+    return usable_bits(params.nframes * len(sample_channels(params, channels)), lsb_count)
+
+def write_stego_audio(cover_audio, payload, output_audio, lsb_count=1, progress=None, key=None, compression=None,
+                      channels=None):
+    # The encoder shared by encode_audio_lsb and encode_audio_buffer. cover_audio and
+    # output_audio are paths or binary file objects (anything wave.open takes); the payload
+    # is a path, bytes or a binary file object.
+    validate_lsb_count(lsb_count)
+
+    # The payload, compressed if asked and wrapped in the length-prefixed container, is read
+    # and split into lsb_count-bit groups a block at a time while it is embedded
+    with phase('load'):
+        payload = PayloadSource(payload, compression)
+
+    # Open cover audio file in binary read mode and stream it to the output a block of
+    # frames at a time, so memory use depends on neither the cover nor the payload size
+    with payload, wave.open(cover_audio, 'rb') as audio:
+        params = audio.getparams()
+        channels = sample_channels(params, channels)
+
+        # Calculate maximum capacity for the payload, one group per selected sample
+        max_capacity_groups = params.nframes * len(channels)
 
         # Check if the payload is too large for the audio cover file
-        if len(binary_payload) > max_capacity_bits:
+        total_groups = group_count(len(payload), lsb_count)
+        if total_groups > max_capacity_groups:
             raise ValueError("Payload too large for the selected audio cover object.")
+        stream = payload.groups(lsb_count)
+
+        with wave.open(output_audio, 'wb') as output:
+            output.setparams(params)  # Use the same parameters
+
+            embedded = 0
+            frames_done = 0
+            if key is not None:
+                # Keyed mode scatters the payload over the whole recording. The groups are
+                # sorted into the blocks their samples fall in up front, then the cover
+                # streams through block by block as in unkeyed mode, so memory follows the
+                # payload size only.
+                block_bytes = CHUNK_FRAMES * params.nchannels * params.sampwidth
+                permutation = carrier_permutation(key, (max_capacity_groups,))
+                patches = defaultdict(list)
+                sorted_groups = 0
+                for groups in stream:
+                    with phase('embed'):
+                        indices = permutation[sorted_groups:sorted_groups + len(groups)]
+                        offsets = sample_byte_offsets(indices, params, channels)
+                        for block, block_offsets, block_groups in split_by_block(offsets, block_bytes, groups):
+                            patches[block].append((block_offsets, block_groups))
+                    sorted_groups += len(groups)
+
+            # Modify LSBs of the blocks that carry the payload
+            block_number = 0
+            while embedded < total_groups:
+                report(progress, frames_done, params.nframes)
+                with phase('load'):
+                    frames = np.frombuffer(audio.readframes(CHUNK_FRAMES), dtype=np.uint8).copy()
+                if not len(frames):
+                    raise ValueError("The audio cover object ended before the payload was embedded.")
+                if key is None:
+                    carrier = sample_lsb_bytes(frames, params, channels)
+                    block_groups = stream.take(len(carrier))
+                    with phase('embed'):
+                        embed_groups(carrier, block_groups, lsb_count)
+                        put_sample_lsb_bytes(frames, params, channels, carrier)
+                    embedded += len(block_groups)
+                else:
+                    with phase('embed'):
+                        for block_offsets, block_groups in patches.pop(block_number, ()):
+                            scatter_groups(frames, block_groups, lsb_count, block_offsets)
+                            embedded += len(block_groups)
+                with phase('save'):
+                    output.writeframes(frames.tobytes())
+                block_number += 1
+                frames_done += len(frames) // (params.nchannels * params.sampwidth)
+
+            # Copy the rest of the stream straight through
+            while True:
+                report(progress, frames_done, params.nframes)
+                with phase('load'):
+                    frames = audio.readframes(CHUNK_FRAMES)
+                if not frames:
+                    break
+                with phase('save'):
+                    output.writeframes(frames)
+                frames_done += len(frames) // (params.nchannels * params.sampwidth)
 
-        # Modify LSBs of the audio samples
-        payload_idx = 0
-        for i in range(len(frames)):
-            if payload_idx < len(binary_payload):
-                # Modify LSB(s)
-                bits_to_modify = binary_payload[payload_idx:payload_idx + lsb_count]
-                bits_to_modify = bits_to_modify.ljust(lsb_count, '0')
-                # Clear the LSB(s) and set the new bits
-                frames[i] = (frames[i] & (~((1 << lsb_count) - 1))) | int(bits_to_modify, 2)
-                payload_idx += lsb_count
-
-        # Save the modified audio file in binary write mode
-        with wave.open(output_audio_path, 'wb') as output_audio:
-            output_audio.setparams(params)  # Use the same parameters
-            output_audio.writeframes(frames)
-
-        print(f"Stego audio saved as {output_audio_path}")
-
-    except ValueError as ve:
-        print(f"Error: {ve}")
-
-    except Exception as e:
-        print(f"Error during audio encoding: {e}")
-
-def decode_audio_lsb(stego_audio_path, lsb_count=1):
-    try:
-        # Validate the lsb_count value
-        if lsb_count < 1 or lsb_count > 8:
-            raise ValueError("LSB count must be between 1 and 8.")
-        
-        # Open stego audio file
-        with wave.open(stego_audio_path, 'rb') as audio:
-            frames = bytearray(list(audio.readframes(audio.getnframes())))
-
-        binary_payload = ""
-        for i in range(len(frames)):
-            # Extract the LSB of each byte
-            binary_payload += format(frames[i] & ((1 << lsb_count) - 1), f'0{lsb_count}b')
-
-        # Group binary into 8-bit chunks (bytes)
-        byte_chunks = [binary_payload[i:i + 8] for i in range(0, len(binary_payload), 8)]
-
-        # Convert binary to string and look for the terminator
-        terminator = '1111111111111110'
-        decoded_message = ""
-        for i in range(0, len(binary_payload), 8):
-            byte = binary_payload[i:i+8]
-            if len(binary_payload) >= i + 16 and binary_payload[i:i+16] == terminator:
+@timed('audio', 'encode')
+def encode_audio_buffer(cover_audio, payload, lsb_count=1, progress=None, key=None, compression=None, channels=None):
+    # encode_audio_lsb without the disk: the cover is a path, WAV bytes or a binary file
+    # object, and the stego WAV file comes back as bytes
+    output = io.BytesIO()
+    write_stego_audio(as_file(cover_audio), payload, output, lsb_count, progress, key, compression, channels)
+    return output.getvalue()
+
+@timed('audio', 'encode')
+def encode_audio_lsb(cover_audio_path, payload_path, output_audio_path, lsb_count=1, progress=None, key=None,
+                     compression=None, channels=None):
+    # The cover is streamed while the output is written, so write next to the output and
+    # move it into place at the end; the output may be the cover itself. A failed or
+    # cancelled job removes only its temporary file and leaves any existing output alone.
+    with replacing(output_audio_path) as temporary_path:
+        write_stego_audio(cover_audio_path, payload_path, temporary_path, lsb_count, progress, key, compression,
+                          channels)
+
+    logger.info("Stego audio saved as %s", output_audio_path)
+    return output_audio_path
+
+@timed('audio', 'encode')
+def encode_audio_mapped(cover_audio_path, payload_path, output_audio_path=None, lsb_count=1, progress=None, key=None,
+                        compression=None, channels=None):
+    # Encode into the WAV itself (output_audio_path None) or into a copy of it, memory-mapping
+    # only the leading frames that carry the payload. The layout is the same as
+    # encode_audio_lsb, so the result decodes with decode_audio_lsb_bytes, and the cost
+    # follows the payload size rather than the length of the cover.
+    validate_lsb_count(lsb_count)
+    with phase('load'):
+        offset, length = wav_data_region(cover_audio_path)
+        with wave.open(cover_audio_path, 'rb') as audio:
+            params = audio.getparams()
+        channels = sample_channels(params, channels)
+        payload = PayloadSource(payload_path, compression)
+    with payload:
+        frame_size = params.nchannels * params.sampwidth
+        total_groups = group_count(len(payload), lsb_count)
+        if total_groups > length // frame_size * len(channels):
+            raise ValueError("Payload too large for the selected audio cover object.")
+        report(progress, 0, total_groups)
+
+        with phase('copy'):
+            output_audio_path = copy_cover(cover_audio_path, output_audio_path)
+        if key is None:
+            mapped_frames = -(-total_groups // len(channels))
+            permutation = None
+        else:
+            # Map all the sample data; only the pages holding scattered positions are written
+            mapped_frames = length // frame_size
+            permutation = carrier_permutation(key, (mapped_frames * len(channels),))
+        samples = np.memmap(output_audio_path, dtype=np.uint8, mode='r+', offset=offset,
+                            shape=(mapped_frames * frame_size,))
+        embedded = 0
+        for groups in payload.groups(lsb_count):
+            report(progress, embedded, total_groups)
+            with phase('embed'):
+                if permutation is None:
+                    indices = np.arange(embedded, embedded + len(groups))
+                else:
+                    indices = permutation[embedded:embedded + len(groups)]
+                # The positions are already in embedding order, so scatter along them directly
+                positions = sample_byte_offsets(indices, params, channels)
+                scatter_groups(samples, groups, lsb_count, positions)
+            embedded += len(groups)
+        with phase('save'):
+            samples.flush()
+    report(progress, total_groups, total_groups)
+
+    logger.info("Stego audio saved as %s", output_audio_path)
+    return output_audio_path
+
+def iter_audio_bytes(audio, lsb_count, progress=None, channels=None):
+    # Yield the bytes hidden in the selected samples (or in every byte of sample data when
+    # channels is None, the layout used before), reading a block of frames at a time so
+    # the caller can stop reading the file as soon as it has what it needs
+    params = audio.getparams()
+    reader = BitReader(lsb_count)
+    while True:
+        report(progress, audio.tell(), audio.getnframes())
+        chunk = np.frombuffer(audio.readframes(CHUNK_FRAMES), dtype=np.uint8)
+        if not len(chunk):
+            break
+        yield reader.feed(chunk if channels is None else sample_lsb_bytes(chunk, params, channels))
+
+def gather_sample_bytes(audio, permutation, count, channels, progress=None):
+    # The low bytes of the samples at the first count positions of the permutation, in
+    # that order, reading the recording from the start a block of frames at a time
+    params = audio.getparams()
+    audio.rewind()
+    if count * DENSE_GATHER_RATIO >= len(permutation):
+        # Most samples are needed: keep every selected low byte (one byte per carrier
+        # value) and gather from that, which beats sorting the reads by block
+        blocks = []
+        while True:
+            report(progress, audio.tell(), audio.getnframes())
+            chunk = np.frombuffer(audio.readframes(CHUNK_FRAMES), dtype=np.uint8)
+            if not len(chunk):
                 break
-            decoded_message += chr(int(byte, 2))
+            blocks.append(np.ascontiguousarray(sample_lsb_bytes(chunk, params, channels)))
+        carrier = np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.uint8)
+        if len(carrier) < count:
+            raise PayloadError("The carrier ended before the whole payload was read.")
+        return np.concatenate([carrier[permutation[start:min(count, start + STREAM_CHUNK_GROUPS)]]
+                               for start in range(0, count, STREAM_CHUNK_GROUPS)])
+
+    # Otherwise sort the reads into the blocks they fall in, and stop after the last block
+    # that holds one
+    block_bytes = CHUNK_FRAMES * params.nchannels * params.sampwidth
+    reads = defaultdict(list)
+    for start in range(0, count, STREAM_CHUNK_GROUPS):
+        indices = permutation[start:min(count, start + STREAM_CHUNK_GROUPS)]
+        offsets = sample_byte_offsets(indices, params, channels)
+        targets = np.arange(start, start + len(indices), dtype=np.uint32 if count <= 1 << 32 else np.intp)
+        for block, block_offsets, block_targets in split_by_block(offsets, block_bytes, targets):
+            reads[block].append((block_offsets, block_targets))
+
+    values = np.empty(count, dtype=np.uint8)
+    block_number = 0
+    while reads:
+        report(progress, audio.tell(), audio.getnframes())
+        chunk = np.frombuffer(audio.readframes(CHUNK_FRAMES), dtype=np.uint8)
+        if not len(chunk):
+            raise PayloadError("The carrier ended before the whole payload was read.")
+        for block_offsets, block_targets in reads.pop(block_number, ()):
+            values[block_targets] = chunk[block_offsets]
+        block_number += 1
+    return values
+
+def read_keyed_payload(audio, lsb_count, key, channels, progress=None):
+    # The container along the key's permutation, or None if there is none: one pass over
+    # the recording for the header's values, then one for exactly as many as it declares
+    params = audio.getparams()
+    permutation = carrier_permutation(key, (params.nframes * len(channels),))
+
+    def read(count, progress=None):
+        return BitReader(lsb_count).feed(gather_sample_bytes(audio, permutation, count, channels, progress))
+
+    header_values = group_count(HEADER.size, lsb_count)
+    if header_values > len(permutation):
+        return None
+    header = parse_header(read(header_values))
+    if header is None:
+        return None
+    _, length, _ = header
+    total_values = group_count(HEADER.size + length, lsb_count)
+    if total_values > len(permutation):
+        raise PayloadError("The carrier ended before the whole payload was read.")
+    return open_payload(header, read(total_values, progress)[HEADER.size:HEADER.size + length])
+
+@timed('audio', 'decode')
+@cached_decode
+def decode_audio_lsb_bytes(stego_audio, lsb_count=1, progress=None, key=None, channels=None):
+    # The payload hidden in a WAV given as a path, WAV bytes or a binary file object
+    validate_lsb_count(lsb_count)
+
+    with wave.open(as_file(stego_audio), 'rb') as audio:
+        params = audio.getparams()
+        selected = sample_channels(params, channels)
+        # Files from before per-sample embedding used every byte of every channel
+        byte_layout = channels is None and params.sampwidth > 1
 
+        if key is not None:
+            # Keyed audio always holds a container, read along the key's permutation
+            with phase('unpack'):
+                payload = read_keyed_payload(audio, lsb_count, key, selected, progress)
+            if payload is None:
+                raise PayloadError("No payload found with this key.")
+            report(progress, audio.getnframes(), audio.getnframes())
+            return payload
 
-        print(f"Decoded message: {decoded_message}")
-        return decoded_message
+        # Read the container header, then exactly as many bytes as it declares (the frames
+        # are read as they are needed, so this phase includes reading the file)
+        with phase('unpack'):
+            payload = unpack_stream(iter_audio_bytes(audio, lsb_count, progress, selected))
+            if payload is None and byte_layout:
+                audio.rewind()
+                payload = unpack_stream(iter_audio_bytes(audio, lsb_count, progress))
+            if payload is None:
+                # Audio encoded before the container format ends with a byte-aligned terminator
+                audio.rewind()
+                payload = read_until_marker(iter_audio_bytes(audio, lsb_count, progress), TERMINATOR)
+        report(progress, audio.getnframes(), audio.getnframes())
+    return payload
 
-    except Exception as e:
-        print(f"Error during audio decoding: {e}")
-        return ""
\ No newline at end of file
+def decode_audio_lsb(stego_audio, lsb_count=1, progress=None, key=None, channels=None):
+    decoded_message = payload_to_text(decode_audio_lsb_bytes(stego_audio, lsb_count, progress, key, channels))
+    logger.debug("Decoded message: %s", decoded_message)
+    return decoded_message
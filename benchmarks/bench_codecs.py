@@ -0,0 +1,206 @@
+# Benchmark every codec end to end on synthetic carriers of several sizes.
+#
+# Usage:
+#   python benchmarks/bench_codecs.py                                  # print the table
+#   python benchmarks/bench_codecs.py --save-baseline benchmarks/baseline.json
+#   python benchmarks/bench_codecs.py --baseline benchmarks/baseline.json [--tolerance 0.25]
+#
+# PNG and BMP images, WAV recordings and FFV1 AVI videos (with an audio track) are
+# generated from random data in a temporary directory, then encode_image/decode_image_bytes,
+# encode_audio_lsb/decode_audio_lsb_bytes and encode_video/decode_video_bytes are timed for
+# every lsb_count. The payload fills half the capacity. Throughput is raw carrier bytes
+# (pixels x 3, sample bytes, frames x pixels x 3) per second. Every encode and decode runs
+# in a fresh process so its peak RSS is its own.
+#
+# With --baseline, cases whose throughput dropped by more than --tolerance are listed and
+# the exit status is 1. Baselines only mean something on the machine that recorded them.
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from audio_steganography import encode_audio_lsb, decode_audio_lsb_bytes, audio_capacity
+from image_steganography import encode_image, decode_image_bytes, image_capacity
+from video_steganography import encode_video, decode_video_bytes, video_capacity, open_video_writer, close_video_writer
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+SAMPLE_RATE = 44100
+VIDEO_FPS = 30
+
+def make_image(path, size, rng):
+    Image.fromarray(rng.integers(0, 256, size=(size, size, 3), dtype=np.uint8)).save(path)
+    return size * size * 3
+
+def make_wav(path, seconds, rng):
+    samples = rng.integers(-2 ** 15, 2 ** 15, size=seconds * SAMPLE_RATE * 2, dtype=np.int16)
+    with wave.open(path, 'wb') as audio:
+        audio.setnchannels(2)
+        audio.setsampwidth(2)
+        audio.setframerate(SAMPLE_RATE)
+        audio.writeframes(samples.tobytes())
+    return samples.nbytes
+
+def make_avi(path, width, height, frames, audio_path, rng):
+    writer = open_video_writer(path, width, height, VIDEO_FPS, audio_path)
+    for _ in range(frames):
+        writer.stdin.write(rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8).tobytes())
+    close_video_writer(writer)
+    return frames * width * height * 3
+
+def build_carriers(args, directory):
+    # (name, codec, path, raw carrier bytes) for every carrier in the run
+    rng = np.random.default_rng(0)
+    carriers = []
+    for size in args.image_sizes:
+        for extension in ('png', 'bmp'):
+            path = os.path.join(directory, f'image_{size}.{extension}')
+            carriers.append((f'{extension}-{size}', 'image', path, make_image(path, size, rng)))
+    for seconds in args.audio_seconds:
+        path = os.path.join(directory, f'audio_{seconds}s.wav')
+        carriers.append((f'wav-{seconds}s', 'audio', path, make_wav(path, seconds, rng)))
+    soundtrack = os.path.join(directory, 'soundtrack.wav')
+    make_wav(soundtrack, 1, rng)
+    for size in args.video_sizes:
+        width, height = map(int, size.split('x'))
+        path = os.path.join(directory, f'video_{size}.avi')
+        carriers.append((f'avi-{size}', 'video', path,
+                         make_avi(path, width, height, args.video_frames, soundtrack, rng)))
+    return carriers
+
+def capacity_bits(codec, path, lsb_count):
+    if codec == 'image':
+        return image_capacity(path, lsb_count)
+    if codec == 'audio':
+        return audio_capacity(path, lsb_count)
+    return video_capacity(path, lsb_count)
+
+def timed(operation, codec, cover, payload_path, output, lsb_count):
+    # Runs in a fresh worker process: returns (seconds, peak RSS in MB or None)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        if operation == 'encode':
+            if codec == 'image':
+                encode_image(cover, payload_path, output, lsb_count)
+            elif codec == 'audio':
+                encode_audio_lsb(cover, payload_path, output, lsb_count)
+            else:
+                encode_video(cover, payload_path, 0, lsb_count, output)
+        else:
+            if codec == 'image':
+                payload = decode_image_bytes(cover, lsb_count)
+            elif codec == 'audio':
+                payload = decode_audio_lsb_bytes(cover, lsb_count)
+            else:
+                payload = decode_video_bytes(cover, 0, lsb_count)
+        seconds = time.perf_counter() - start
+    if operation == 'decode':
+        with open(payload_path, 'rb') as file:
+            if payload != file.read():
+                raise ValueError(f"Decoded payload does not match for {cover}")
+    return seconds, peak_rss_mb()
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / (1 << 10)
+
+def run_cases(args, carriers, directory):
+    results = {}
+    # maxtasksperchild=1 gives every encode and decode its own process (and RSS peak)
+    with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+        for name, codec, path, carrier_bytes in carriers:
+            for lsb_count in args.lsb_counts:
+                payload_bytes = capacity_bits(codec, path, lsb_count) // 8 // 2
+                payload_path = os.path.join(directory, 'payload.bin')
+                with open(payload_path, 'wb') as file:
+                    file.write(os.urandom(payload_bytes))
+                output = os.path.join(directory, f'stego_{name}_{lsb_count}' +
+                                      {'image': '.png', 'audio': '.wav', 'video': '.avi'}[codec])
+
+                case = f'{name}/lsb{lsb_count}'
+                results[case] = {'carrier_bytes': carrier_bytes, 'payload_bytes': payload_bytes}
+                for operation, cover in (('encode', path), ('decode', output)):
+                    seconds, rss = min(
+                        (pool.apply(timed, (operation, codec, cover, payload_path, output, lsb_count))
+                         for _ in range(args.repeat)), key=lambda result: result[0])
+                    results[case][operation] = {
+                        'seconds': round(seconds, 6),
+                        'mb_per_s': round(carrier_bytes / seconds / 1e6, 3),
+                        'peak_rss_mb': rss and round(rss, 1),
+                    }
+                print_row(case, results[case])
+    return results
+
+def print_row(case, result):
+    cells = [f"{case:<22}", f"{result['carrier_bytes'] / 1e6:>9.2f}", f"{result['payload_bytes'] / 1e6:>9.3f}"]
+    for operation in ('encode', 'decode'):
+        timing = result[operation]
+        rss = timing['peak_rss_mb']
+        cells += [f"{timing['seconds']:>9.4f}", f"{timing['mb_per_s']:>9.1f}", f"{rss if rss is not None else '-':>8}"]
+    print(' '.join(cells), flush=True)
+
+def compare(results, baseline, tolerance):
+    # Cases (and operations) whose throughput fell by more than tolerance
+    regressions = []
+    for case, result in results.items():
+        for operation in ('encode', 'decode'):
+            old = baseline.get(case, {}).get(operation)
+            if not old:
+                continue
+            change = result[operation]['mb_per_s'] / old['mb_per_s'] - 1
+            if change < -tolerance:
+                regressions.append((case, operation, old['mb_per_s'], result[operation]['mb_per_s'], change))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--image-sizes', type=int, nargs='+', default=[256, 1024, 2048])
+    parser.add_argument('--audio-seconds', type=int, nargs='+', default=[10, 120])
+    parser.add_argument('--video-sizes', nargs='+', default=['320x240', '1280x720'])
+    parser.add_argument('--video-frames', type=int, default=30)
+    parser.add_argument('--lsb-counts', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per case; the fastest is kept")
+    parser.add_argument('--baseline', help="Compare against this baseline JSON file")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed throughput drop against the baseline (0.25 = 25%%)")
+    parser.add_argument('--save-baseline', help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        carriers = build_carriers(args, directory)
+        print(f"{'case':<22} {'carrier MB':>9} {'payload MB':>9} "
+              f"{'enc (s)':>9} {'enc MB/s':>9} {'enc RSS':>8} {'dec (s)':>9} {'dec MB/s':>9} {'dec RSS':>8}")
+        results = run_cases(args, carriers, directory)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for case, operation, old, new, change in regressions:
+            print(f"REGRESSION {case} {operation}: {old:.1f} -> {new:.1f} MB/s ({change:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# Benchmark the vectorized image encoder against the original per-channel loop.
+#
+# Usage: python benchmarks/bench_image_encode.py [--sizes 128 256 512 1024 2048] [--legacy-max 512]
+#
+# Every size is checked for byte-identical output against the loop for lsb_count 1..8
+# (as long as the size is within --legacy-max, since the loop takes minutes on large covers).
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from image_steganography import embed_payload
+
+END_MARKER = "###END###"
+
+def text_to_binary(text):
+    # The payload as a '0101...' string, as the original encoder built it
+    return ''.join(format(ord(char), '08b') for char in text)
+
+def legacy_encode(image_array, text, lsb_count):
+    # The encode loop from before the vectorized engine. The mask is applied through a
+    # Python int because NumPy 2 refuses to combine uint8 with a negative Python int.
+    binary_text = text_to_binary(text + END_MARKER)
+    binary_index = 0
+    binary_len = len(binary_text)
+    keep_mask = ~((1 << lsb_count) - 1) & 0xFF
+
+    for row in image_array:
+        for pixel in row:
+            for channel in range(3):
+                if binary_index < binary_len:
+                    bits_to_encode = binary_text[binary_index:binary_index+lsb_count]
+                    if len(bits_to_encode) < lsb_count:
+                        bits_to_encode = bits_to_encode.ljust(lsb_count, '0')
+                    pixel[channel] = (int(pixel[channel]) & keep_mask) | int(bits_to_encode, 2)
+                    binary_index += lsb_count
+            if binary_index >= binary_len:
+                break
+
+    if binary_index < binary_len:
+        raise ValueError("The message is too long to be encoded in the image.")
+    return image_array
+
+def make_case(size, lsb_count, rng):
+    cover = rng.integers(0, 256, size=(size, size, 3), dtype=np.uint8)
+    # Fill about 90% of the capacity so both encoders touch nearly every channel
+    capacity_bytes = size * size * 3 * lsb_count // 8
+    text_length = max(1, int(capacity_bytes * 0.9) - len(END_MARKER))
+    text = ''.join(map(chr, rng.integers(32, 127, size=text_length)))
+    return cover, text
+
+def time_call(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[128, 256, 512, 1024, 2048])
+    parser.add_argument('--legacy-max', type=int, default=512,
+                        help="Largest size to run the original loop on")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'size':>6} {'lsb':>3} {'vectorized (s)':>15} {'loop (s)':>10} {'speedup':>8}")
+    for size in args.sizes:
+        for lsb_count in range(1, 9):
+            cover, text = make_case(size, lsb_count, rng)
+            payload = (text + END_MARKER).encode('latin-1')
+
+            fast = cover.copy()
+            fast_time = time_call(embed_payload, fast, payload, lsb_count)
+
+            if size <= args.legacy_max:
+                slow = cover.copy()
+                slow_time = time_call(legacy_encode, slow, text, lsb_count)
+                if not np.array_equal(fast, slow):
+                    sys.exit(f"Output mismatch at size={size} lsb_count={lsb_count}")
+                print(f"{size:>6} {lsb_count:>3} {fast_time:>15.4f} {slow_time:>10.3f} "
+                      f"{slow_time / fast_time:>7.0f}x")
+            else:
+                print(f"{size:>6} {lsb_count:>3} {fast_time:>15.4f} {'-':>10} {'-':>8}")
+
+if __name__ == '__main__':
+    main()
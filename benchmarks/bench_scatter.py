@@ -0,0 +1,62 @@
+# Benchmark keyed (scattered) embedding against the sequential vectorized path.
+#
+# Usage: python benchmarks/bench_scatter.py [--sizes 256 512 1024 2048] [--fill 0.9]
+#
+# "first job" pays for evaluating the key's permutation for the payload values (it grows
+# with the payload, not the carrier) plus the embed along those positions; "repeat job"
+# is the same embed on another carrier of the same size, which takes the positions from
+# the cache. The ratio is the repeat job against the sequential embed, and the last column
+# says whether it is within TARGET_RATIO of it.
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from lsb_utils import embed_groups
+from scatter import carrier_permutation, scatter_groups, gather_groups
+
+# How many times the sequential embed a repeated keyed embed may take
+TARGET_RATIO = 5
+
+def time_call(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+def keyed_embed(carrier, groups, lsb_count, key):
+    # What a keyed encoder does for one job
+    scatter_groups(carrier, groups, lsb_count, carrier_permutation(key, carrier.shape))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256, 512, 1024, 2048],
+                        help="Square RGB image sizes to use as carriers")
+    parser.add_argument('--fill', type=float, default=0.9, help="Fraction of the carrier to fill")
+    parser.add_argument('--lsb-count', type=int, default=1)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'size':>6} {'values':>10} {'sequential (s)':>15} {'first job (s)':>14} {'repeat job (s)':>15} "
+          f"{'ratio':>6} {'target':>7}")
+    for size in args.sizes:
+        carrier = rng.integers(0, 256, size=size * size * 3, dtype=np.uint8)
+        groups = rng.integers(0, 1 << args.lsb_count, size=int(len(carrier) * args.fill), dtype=np.uint8)
+
+        sequential_time, _ = time_call(embed_groups, carrier.copy(), groups, args.lsb_count)
+        first_time, _ = time_call(keyed_embed, carrier.copy(), groups, args.lsb_count, f"benchmark-{size}")
+        scattered = carrier.copy()
+        repeat_time, _ = time_call(keyed_embed, scattered, groups, args.lsb_count, f"benchmark-{size}")
+        permutation = carrier_permutation(f"benchmark-{size}", carrier.shape)
+        if not np.array_equal(gather_groups(scattered, len(groups), args.lsb_count, permutation), groups):
+            sys.exit(f"Roundtrip mismatch at size={size}")
+
+        ratio = repeat_time / sequential_time
+        print(f"{size:>6} {len(carrier):>10} {sequential_time:>15.4f} {first_time:>14.4f} {repeat_time:>15.4f} "
+              f"{ratio:>5.1f}x {'ok' if ratio <= TARGET_RATIO else 'over':>7}")
+
+if __name__ == '__main__':
+    main()
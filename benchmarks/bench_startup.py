@@ -0,0 +1,65 @@
+# Benchmark cold start: how long the front ends take to import, and what they pull in.
+#
+# Usage: python benchmarks/bench_startup.py [--repeat 5]
+#
+# Every case runs in a fresh interpreter, so nothing is already imported. The time is
+# the median over --repeat runs of the case's own imports (interpreter startup is not
+# included). "ready" cases also load the codec module a job on that file type needs,
+# which is what the CLI does before its first job. The last column lists the heavy
+# backends the case ended up importing. The GUI case is skipped when tkinterdnd2 or
+# tkinter is missing.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+HEAVY_MODULES = ('numpy', 'PIL.Image', 'cv2', 'imageio_ffmpeg', 'av', 'tkVideoPlayer')
+
+CASES = [
+    ('gui import', "import steganography_app"),
+    ('cli import', "import steganography_cli"),
+    ('cli ready for .wav', "import steganography_cli, codec_registry; codec_registry.codec_for('x.wav').module"),
+    ('cli ready for .png', "import steganography_cli, codec_registry; codec_registry.codec_for('x.png').module"),
+    ('cli ready for .avi', "import steganography_cli, codec_registry; codec_registry.codec_for('x.avi').module"),
+    ('capacity import', "import capacity"),
+    ('every codec (eager)', "import audio_steganography, image_steganography, video_steganography, text_steganography"),
+]
+
+CHILD = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+{code}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'modules': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+def run_case(code):
+    # (seconds, heavy modules) from one fresh interpreter, or None if the imports failed
+    child = CHILD.format(root=ROOT, code=code, heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, '-c', child], capture_output=True, text=True, cwd=ROOT)
+    if result.returncode != 0:
+        return None
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return report['seconds'], report['modules']
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'case':<22} {'import (s)':>10}  heavy modules loaded")
+    for name, code in CASES:
+        runs = [run_case(code) for _ in range(args.repeat)]
+        if None in runs:
+            print(f"{name:<22} {'skipped':>10}  (imports failed in this environment)")
+            continue
+        seconds = statistics.median(run[0] for run in runs)
+        print(f"{name:<22} {seconds:>10.3f}  {', '.join(runs[0][1]) or '-'}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# Benchmark the whitespace text codec against the string-concatenation loops it replaced.
+#
+# Usage: python benchmarks/bench_text.py [--sizes 10000 100000 1000000 10000000] [--legacy-max 1000000]
+#
+# Times encode_text_buffer and decode_text_bytes, the entry points the front ends use, on
+# a cover held in memory. The payload fills the cover (one hidden bit per cover
+# character). The original loops only run up to --legacy-max cover characters, since they
+# grow quadratically on CPython builds that cannot resize the string in place.
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from payload import HEADER
+from text_steganography import encode_text_buffer, decode_text_bytes, legacy_reveal_from_text
+
+def legacy_encode(cover_data, payload_data):
+    # The encode loop from the GUI before text_steganography existed
+    payload_bits_str = ''.join(format(ord(char), '07b') for char in payload_data)
+    encoded_text = ''
+    payload_index = 0
+    for char in cover_data:
+        encoded_text += char
+        if payload_index < len(payload_bits_str):
+            if payload_bits_str[payload_index] == '1':
+                encoded_text += '\t'
+            else:
+                encoded_text += ' '
+            payload_index += 1
+    while payload_index < len(payload_bits_str):
+        if payload_bits_str[payload_index] == '1':
+            encoded_text += '\t'
+        else:
+            encoded_text += ' '
+        payload_index += 1
+    return encoded_text
+
+def legacy_decode(encoded_data):
+    extracted_bits = ''
+    for char in encoded_data:
+        if char == '\t':
+            extracted_bits += '1'
+        elif char == ' ':
+            extracted_bits += '0'
+    decoded_message = ''
+    for i in range(0, len(extracted_bits), 7):
+        byte = extracted_bits[i:i + 7]
+        if len(byte) == 7:
+            decoded_message += chr(int(byte, 2))
+    return decoded_message
+
+def time_call(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000, 10000000])
+    parser.add_argument('--legacy-max', type=int, default=1000000,
+                        help="Largest cover (in characters) to run the original loops on")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'chars':>9} {'encode (s)':>11} {'decode (s)':>11} {'loop enc (s)':>13} {'loop dec (s)':>13}")
+    for size in args.sizes:
+        # Letters only, so the legacy decoder (which reads every tab and space) works too
+        cover = rng.integers(ord('a'), ord('z') + 1, size=size, dtype=np.uint8).tobytes()
+        # The payload and its container header fill the cover
+        payload = rng.integers(32, 127, size=size // 8 - HEADER.size, dtype=np.uint8).tobytes()
+
+        encode_time, stego = time_call(encode_text_buffer, cover, payload)
+        decode_time, decoded = time_call(decode_text_bytes, stego)
+        if decoded != payload:
+            sys.exit(f"Roundtrip mismatch at {size} characters")
+
+        if size <= args.legacy_max:
+            text = payload.decode('ascii')
+            loop_encode_time, legacy_stego = time_call(legacy_encode, cover.decode('ascii'), text)
+            loop_decode_time, legacy_text = time_call(legacy_decode, legacy_stego)
+            if legacy_reveal_from_text(legacy_stego).decode('ascii') != legacy_text:
+                sys.exit(f"Legacy decode mismatch at {size} characters")
+            print(f"{size:>9} {encode_time:>11.4f} {decode_time:>11.4f} "
+                  f"{loop_encode_time:>13.3f} {loop_decode_time:>13.3f}")
+        else:
+            print(f"{size:>9} {encode_time:>11.4f} {decode_time:>11.4f} {'-':>13} {'-':>13}")
+
+if __name__ == '__main__':
+    main()
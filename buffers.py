@@ -0,0 +1,51 @@
+import contextlib
+import io
+import os
+import secrets
+
+# Covers, stego carriers and payloads can be given to the codecs as a filesystem path
+# (str or os.PathLike), as the data itself (bytes, bytearray or memoryview), or as an open
+# binary file object. These helpers tell them apart and give the codecs something they can
+# open, so callers holding an upload in memory never have to write it to disk.
+
+def is_path(source):
+    return isinstance(source, (str, os.PathLike))
+
+def is_buffer(source):
+    return isinstance(source, (bytes, bytearray, memoryview))
+
+def as_file(source):
+    # A path is returned as it is (every reader the codecs use opens paths itself); data
+    # is wrapped in a BytesIO; file objects are used from their current position
+    if is_buffer(source):
+        return io.BytesIO(source)
+    if is_path(source) or hasattr(source, 'read'):
+        return source
+    raise TypeError(f"Expected a path, bytes or a binary file object, not {type(source).__name__}.")
+
+def source_size(source):
+    # Bytes left to read from a path, buffer or seekable file object
+    if is_path(source):
+        return os.path.getsize(source)
+    if is_buffer(source):
+        return memoryview(source).nbytes
+    position = source.tell()
+    size = source.seek(0, os.SEEK_END) - position
+    source.seek(position)
+    return size
+
+@contextlib.contextmanager
+def replacing(path):
+    # A temporary path next to path that is moved onto it once the block succeeds, so an
+    # output that is also the input is only replaced after it has been read, and a failed or
+    # cancelled write leaves whatever was at path alone. The temporary file keeps path's
+    # extension (ffmpeg picks the container from it) and is removed if the block fails.
+    directory, name = os.path.split(os.path.abspath(path))
+    temporary = os.path.join(directory, f".{secrets.token_hex(8)}-{name}")
+    try:
+        yield temporary
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
@@ -0,0 +1,10 @@
+from codec_registry import codec_for
+
+# Capacity probing for every cover type. Only metadata is read (the PIL header, the WAV
+# params, the video container properties), so probing a multi-GB cover is instant. Text
+# covers have no header, so their characters are counted without keeping the text.
+# Results are exact usable payload bits for the given lsb_count and mode, with the
+# payload container header already taken out. Only the cover's own codec is imported.
+
+def probe_capacity(cover_path, lsb_count=1, mode='frame', **video_options):
+    return codec_for(cover_path).capacity(cover_path, lsb_count, mode=mode, **video_options)
@@ -0,0 +1,183 @@
+import importlib
+import os
+
+# The cover formats and the codec that handles each of them. Front ends (the GUI, the
+# CLI, the job server, capacity probing) look a file up with codec_for and call the
+# codec's encode/decode/capacity instead of testing extensions themselves.
+#
+# A codec only names the module that implements it. The module, and with it NumPy, PIL,
+# OpenCV or ffmpeg, is imported the first time one of the codec's operations runs, so a
+# front end that only handles WAV files never pays for OpenCV at startup.
+#
+# Every codec takes the same arguments; options that do not apply to it are ignored:
+#   encode(cover, payload, output, lsb_count, progress, key, compression, **options) -> output path
+#   encode_buffer(cover, payload, lsb_count, progress, key, compression, **options) -> stego bytes
+#   decode(stego, lsb_count, progress, key, **options) -> payload bytes
+#   capacity(cover, lsb_count, **options) -> usable payload bits
+# with options compress_level and mapped (image), mapped and audio_channels (audio), and
+# mode, frame_number, channels, start_frame, end_frame and workers (video).
+
+class Codec:
+    # Set by each codec below
+    name = None
+    extensions = ()
+    module_name = None
+    output_extension = None
+    file_type = None  # Name of the output type in save dialogs, e.g. "PNG files"
+    media_type = None
+    # Whether the codec can read and write carriers held in memory (encode_buffer)
+    in_memory = True
+
+    def __init__(self):
+        self._module = None
+
+    @property
+    def module(self):
+        if self._module is None:
+            self._module = importlib.import_module(self.module_name)
+        return self._module
+
+    def function(self, name):
+        return getattr(self.module, name)
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.name} {' '.join(self.extensions)}>"
+
+class ImageCodec(Codec):
+    name = 'image'
+    extensions = ('.png', '.bmp')
+    module_name = 'image_steganography'
+    output_extension = '.png'
+    file_type = "PNG files"
+    media_type = 'image/png'
+
+    def encode(self, cover, payload, output, lsb_count=1, progress=None, key=None, compression=None,
+               compress_level=None, mapped=False, **options):
+        if mapped and extension_of(cover) == '.bmp':
+            return self.function('encode_bmp_mapped')(cover, payload, output, lsb_count, progress, key, compression)
+        if compress_level is None:
+            compress_level = self.function('PNG_COMPRESS_LEVEL')
+        return self.function('encode_image')(cover, payload, output, lsb_count, progress, compress_level, key,
+                                             compression)
+
+    def encode_buffer(self, cover, payload, lsb_count=1, progress=None, key=None, compression=None,
+                      compress_level=None, **options):
+        if compress_level is None:
+            compress_level = self.function('PNG_COMPRESS_LEVEL')
+        return self.function('encode_image_buffer')(cover, payload, lsb_count, progress, compress_level, key,
+                                                    compression)
+
+    def decode(self, stego, lsb_count=1, progress=None, key=None, **options):
+        return self.function('decode_image_bytes')(stego, lsb_count, progress, key)
+
+    def capacity(self, cover, lsb_count=1, **options):
+        return self.function('image_capacity')(cover, lsb_count)
+
+class AudioCodec(Codec):
+    name = 'audio'
+    extensions = ('.wav',)
+    module_name = 'audio_steganography'
+    output_extension = '.wav'
+    file_type = "WAV files"
+    media_type = 'audio/wav'
+
+    def encode(self, cover, payload, output, lsb_count=1, progress=None, key=None, compression=None,
+               mapped=False, audio_channels=None, **options):
+        function = self.function('encode_audio_mapped' if mapped else 'encode_audio_lsb')
+        return function(cover, payload, output, lsb_count, progress, key, compression, audio_channels)
+
+    def encode_buffer(self, cover, payload, lsb_count=1, progress=None, key=None, compression=None,
+                      audio_channels=None, **options):
+        return self.function('encode_audio_buffer')(cover, payload, lsb_count, progress, key, compression,
+                                                    audio_channels)
+
+    def decode(self, stego, lsb_count=1, progress=None, key=None, audio_channels=None, **options):
+        return self.function('decode_audio_lsb_bytes')(stego, lsb_count, progress, key, audio_channels)
+
+    def capacity(self, cover, lsb_count=1, audio_channels=None, **options):
+        return self.function('audio_capacity')(cover, lsb_count, audio_channels)
+
+class VideoCodec(Codec):
+    name = 'video'
+    extensions = ('.mp4', '.avi')
+    module_name = 'video_steganography'
+    output_extension = '.avi'
+    file_type = "AVI files"
+    media_type = 'video/x-msvideo'
+    # OpenCV and ffmpeg only open files
+    in_memory = False
+
+    def encode(self, cover, payload, output, lsb_count=1, progress=None, key=None, compression=None,
+               mode='frame', frame_number=0, start_frame=0, end_frame=None, channels=3, workers=None, **options):
+        if mode == 'spread':
+            return self.function('encode_video_spread')(cover, payload, lsb_count, output, start_frame, end_frame,
+                                                        channels, workers, progress, key, compression)
+        return self.function('encode_video')(cover, payload, frame_number, lsb_count, output, progress, key,
+                                             compression)
+
+    def decode(self, stego, lsb_count=1, progress=None, key=None, mode='frame', frame_number=0, start_frame=0,
+               channels=3, workers=None, **options):
+        if mode == 'spread':
+            return self.function('decode_video_spread_bytes')(stego, lsb_count, channels, start_frame, workers,
+                                                              progress, key)
+        return self.function('decode_video_bytes')(stego, frame_number, lsb_count, progress, key)
+
+    def capacity(self, cover, lsb_count=1, mode='frame', start_frame=0, end_frame=None, channels=3, **options):
+        return self.function('video_capacity')(cover, lsb_count, mode, start_frame, end_frame, channels)
+
+    def properties(self, cover):
+        # (width, height, fps, frame count) from the container metadata
+        return self.function('video_properties')(cover)
+
+class TextCodec(Codec):
+    name = 'text'
+    extensions = ('.txt',)
+    module_name = 'text_steganography'
+    output_extension = '.txt'
+    file_type = "Text files"
+    media_type = 'text/plain; charset=utf-8'
+
+    def encode(self, cover, payload, output, lsb_count=1, progress=None, key=None, compression=None, **options):
+        check_unkeyed(key)
+        return self.function('encode_text')(cover, payload, output, progress, compression)
+
+    def encode_buffer(self, cover, payload, lsb_count=1, progress=None, key=None, compression=None, **options):
+        check_unkeyed(key)
+        return self.function('encode_text_buffer')(cover, payload, progress, compression)
+
+    def decode(self, stego, lsb_count=1, progress=None, key=None, **options):
+        check_unkeyed(key)
+        return self.function('decode_text_bytes')(stego, progress)
+
+    def capacity(self, cover, lsb_count=1, **options):
+        return self.function('text_capacity')(cover)
+
+def check_unkeyed(key):
+    if key is not None:
+        raise ValueError("Keyed mode is not available for text covers.")
+
+CODECS = {codec.name: codec for codec in (ImageCodec(), AudioCodec(), VideoCodec(), TextCodec())}
+
+# Compression methods every codec accepts, with the id the payload container records for
+# each. Kept here so front ends can list them without importing the payload pipeline.
+COMPRESSION_IDS = {'zlib': 1, 'lzma': 2, 'zstd': 3}
+
+# Codec for each cover extension
+EXTENSIONS = {extension: codec for codec in CODECS.values() for extension in codec.extensions}
+
+def extension_of(path):
+    return os.path.splitext(os.fspath(path))[1].lower()
+
+def is_supported(path):
+    return extension_of(path) in EXTENSIONS
+
+def codec_for(path):
+    extension = extension_of(path)
+    if extension not in EXTENSIONS:
+        raise ValueError(f"Unsupported cover type: {extension or path}")
+    return EXTENSIONS[extension]
+
+def codec_named(name):
+    if name not in CODECS:
+        raise ValueError(f"Unknown codec: {name}")
+    return CODECS[name]
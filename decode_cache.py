@@ -0,0 +1,191 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+from buffers import is_path, is_buffer
+from instrumentation import phase
+from progress import report
+
+# Persistent cache of decode results, so decoding the same stego file again (with the
+# same settings) is a file read instead of a full extraction. Off until
+# enable_decode_cache is called; the GUI, the CLI and the job server turn it on only when
+# given --cache-dir, since every cached result is a hidden payload stored in the clear.
+#
+# Entries are keyed by a SHA-256 of the carrier's content plus the decode function and
+# its parameters (lsb_count, frame_number, mode, channels, ...), so renaming or copying a
+# file still hits and editing it never does. Files are hashed a block at a time and the
+# hash is remembered per (path, size, mtime, inode), so an unchanged file is not read
+# again; carriers given as bytes (uploads to the job server) are hashed directly.
+#
+#   <directory>/results/<key>     decoded payload bytes
+#   <directory>/carriers/<key>    content hash of a carrier seen before
+#
+# Both kinds of entry are kept under max_bytes together by dropping the least recently
+# used ones (a hit touches the file's mtime). Each file counts as at least one disk block,
+# so the many tiny carrier entries are bounded too. Decodes with a key are never cached.
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'steganography', 'decode')
+DEFAULT_CACHE_BYTES = 256 << 20
+
+# Part of every key; bump it when a decoder's output changes for the same input
+CACHE_VERSION = 1
+
+# Bytes read per step while hashing a carrier
+HASH_BLOCK_SIZE = 1 << 20
+
+# Name prefix of entries that are still being written
+TEMPORARY_PREFIX = '.tmp-'
+
+# Smallest size an entry is counted as when enforcing max_bytes
+ENTRY_BLOCK_SIZE = 4096
+
+# Arguments that do not change the decoded payload
+IGNORED_ARGUMENTS = ('progress', 'workers')
+
+_active_cache = None
+
+class DecodeCache:
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.results = os.path.join(directory, 'results')
+        self.carriers = os.path.join(directory, 'carriers')
+        os.makedirs(self.results, exist_ok=True)
+        os.makedirs(self.carriers, exist_ok=True)
+
+    def content_hash(self, path):
+        # SHA-256 of the file, reused while its size, mtime and inode stay the same
+        if is_buffer(path):
+            return hashlib.sha256(path).hexdigest()
+        stat = os.stat(path)
+        identity = f"{os.path.realpath(path)}\0{stat.st_size}\0{stat.st_mtime_ns}\0{stat.st_ino}\0{stat.st_dev}"
+        memo = os.path.join(self.carriers, hashlib.sha256(identity.encode('utf-8', 'surrogateescape')).hexdigest())
+        try:
+            with open(memo, 'r') as file:
+                content_hash = file.read()
+            os.utime(memo)
+            return content_hash
+        except FileNotFoundError:
+            pass
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            while True:
+                block = file.read(HASH_BLOCK_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+        self.write_atomic(memo, digest.hexdigest().encode('ascii'))
+        self.evict()
+        return digest.hexdigest()
+
+    def result_key(self, operation, carrier, parameters):
+        description = json.dumps([CACHE_VERSION, operation, self.content_hash(carrier), parameters], sort_keys=True)
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        # The cached payload, or None; a hit makes the entry the most recently used
+        path = os.path.join(self.results, key)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, key, data):
+        if max(len(data), ENTRY_BLOCK_SIZE) > self.max_bytes:
+            return
+        self.write_atomic(os.path.join(self.results, key), data)
+        self.evict()
+
+    def evict(self):
+        # Drop the least recently used entries (results and carrier hashes alike) until the
+        # total fits in max_bytes
+        entries = []
+        for directory in (self.results, self.carriers):
+            for entry in os.scandir(directory):
+                if entry.name.startswith(TEMPORARY_PREFIX):
+                    continue  # Being written by another process
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # Evicted by another process in the meantime
+                entries.append((stat.st_mtime_ns, max(stat.st_size, ENTRY_BLOCK_SIZE), entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for directory in (self.results, self.carriers):
+            for entry in os.scandir(directory):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def write_atomic(self, path, data):
+        # Readers (possibly in other processes) only ever see a whole entry
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix=TEMPORARY_PREFIX)
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+def enable_decode_cache(directory=None, max_bytes=DEFAULT_CACHE_BYTES):
+    # Turn the cache on for this process (also usable as a worker pool initializer)
+    global _active_cache
+    _active_cache = DecodeCache(directory or DEFAULT_CACHE_DIR, max_bytes)
+    return _active_cache
+
+def disable_decode_cache():
+    global _active_cache
+    _active_cache = None
+
+def active_decode_cache():
+    return _active_cache
+
+def cached_decode(func):
+    # Decorator for the decode_*_bytes functions, whose first argument is the carrier.
+    # Paths and bytes are cached (file objects are not, since hashing would consume them),
+    # and only without a key.
+    signature = inspect.signature(func)
+    operation = f"{func.__module__}.{func.__name__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        cache = _active_cache
+        if cache is None:
+            return func(*args, **kwargs)
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+        carrier = arguments.pop(next(iter(signature.parameters)))
+        if not (is_path(carrier) or is_buffer(carrier)) or arguments.get('key') is not None:
+            return func(*args, **kwargs)
+
+        parameters = {name: value for name, value in arguments.items() if name not in IGNORED_ARGUMENTS}
+        with phase('cache'):
+            key = cache.result_key(operation, os.fspath(carrier) if is_path(carrier) else carrier, parameters)
+            payload = cache.get(key)
+        if payload is not None:
+            report(arguments.get('progress'), 1, 1)
+            return payload
+        payload = func(*args, **kwargs)
+        with phase('cache'):
+            cache.put(key, payload)
+        return payload
+    return wrapper
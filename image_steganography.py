@@ -1,145 +1,290 @@
 from PIL import Image
+import io
+import logging
 import numpy as np
 import os
+import struct
+from lsb_utils import validate_lsb_count, embed_groups, group_count, copy_cover, BitReader, STREAM_CHUNK_GROUPS
+from payload import PayloadSource, payload_groups, unpack_stream, read_until_marker, payload_to_text, usable_bits, PayloadError
+from scatter import carrier_permutation, scatter_groups, iter_scattered_bytes
+from progress import report
+from instrumentation import timed, phase
+from decode_cache import cached_decode
+from buffers import as_file, is_path
 
-def text_to_binary(text):
-    # Convert the text into a binary string
-    return ''.join(format(ord(char), '08b') for char in text)
-
-def convert_to_png(image_path):
-    # Load the image using PIL
-    image = Image.open(image_path)
-    
-    # Check if the image is already a PNG
-    if image_path.lower().endswith('.png'):
-        return image_path  # No conversion needed if it's already PNG
-    
-    # Convert to PNG
-    base_name = os.path.splitext(image_path)[0]  # Get the file name without extension
-    png_image_path = base_name + '.png'  # Change the extension to .png
-    image.save(png_image_path, 'PNG')  # Save the image as PNG
-    print(f"Converted {image_path} to {png_image_path}")
-    
-    return png_image_path
-
-def save_encoded_image(image_array, output_image):
-    output_dir = "encoded"
-    
-    # Ensure the output directory exists
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    # Combine directory and file name to get the full path
-    output_path = os.path.join(output_dir, output_image)
+# End marker of the text-only format used before the payload container
+END_MARKER = b"###END###"
+
+# Number of channel values extracted per step while decoding
+DECODE_CHUNK_CHANNELS = 1 << 18
+
+# BITMAPFILEHEADER (signature, file size, reserved, pixel data offset) and the start of the
+# BITMAPINFOHEADER (header size, width, height, planes, bits per pixel, compression)
+BMP_FILE_HEADER = struct.Struct('<2sIHHI')
+BMP_INFO_HEADER = struct.Struct('<IiiHHI')
+BI_RGB = 0
+
+# zlib level for the stego PNG; 6 is PIL's default
+PNG_COMPRESS_LEVEL = 6
+
+logger = logging.getLogger(__name__)
+
+def load_image_array(image):
+    # Decode the image (a path, the image file's bytes or a binary file object) straight to
+    # a pixel array, whatever lossless format PIL reads it from; nothing is written to disk.
+    # Palette and greyscale images are expanded to RGB. A pixel array is copied as it is.
+    if isinstance(image, np.ndarray):
+        if image.dtype != np.uint8:
+            raise ValueError("The pixel array must hold 8-bit values.")
+        return image.copy()
+    with Image.open(as_file(image)) as image:
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+        return np.array(image)
+
+def image_to_png(image_array, compress_level=PNG_COMPRESS_LEVEL):
+    # The PNG file for a pixel array, in memory
+    buffer = io.BytesIO()
+    Image.fromarray(image_array).save(buffer, format='PNG', compress_level=compress_level)
+    return buffer.getvalue()
+
+def save_encoded_image(image_array, output_image, compress_level=PNG_COMPRESS_LEVEL):
+    output_path = output_image
+
+    # A bare file name goes under encoded/; a path with a directory part is used as it is
+    if not os.path.dirname(output_image):
+        output_dir = "encoded"
+
+        # Ensure the output directory exists
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        # Combine directory and file name to get the full path
+        output_path = os.path.join(output_dir, output_image)
 
     # Convert the NumPy array back into a PIL image object
     encoded_image = Image.fromarray(image_array)
 
-    # Save the encoded image as a PNG (lossless format)
-    encoded_image.save(output_path, format='PNG')
+    # Save the encoded image as a PNG (lossless format). The level only trades time for file
+    # size: 0-1 for throughput-bound jobs, 9 for the smallest file.
+    encoded_image.save(output_path, format='PNG', compress_level=compress_level)
 
     return output_path
 
-def encode_image(image_path, text_file, output_image, lsb_count=1):
-    if lsb_count < 1 or lsb_count > 8:
-        raise ValueError("LSB count must be between 1 and 8.")
-    
-    # Convert the input image to PNG if it's not already in PNG format
-    png_image_path = convert_to_png(image_path)
-
-    image = Image.open(png_image_path)
-    image_array = np.array(image)
-
-    # Read the text to be encoded from the file
-    with open(text_file, 'r') as file:
-        text = file.read()
-    
-    # Append the end marker to the text
-    text += "###END###"
-    binary_text = text_to_binary(text)
-    binary_index = 0
-    binary_len = len(binary_text)
-    
-    # Calculate the number of bits we can store per pixel
-    bits_per_pixel = 3 * lsb_count  # 3 channels, each using lsb_count bits
-
-    for row in image_array:
-        for pixel in row:
-            # Modify R, G, B channels of the pixel
-            for channel in range(3):  # 3 channels: Red, Green, Blue
-                if binary_index < binary_len:
-                    # Extract the next bits to encode (depending on lsb_count)
-                    bits_to_encode = binary_text[binary_index:binary_index+lsb_count]
-                    if len(bits_to_encode) < lsb_count:
-                        bits_to_encode = bits_to_encode.ljust(lsb_count, '0')
-                    
-                    # Clear the least significant bits in the pixel's channel
-                    pixel[channel] &= ~( (1 << lsb_count) - 1 )
-                    
-                    # Encode the bits in the pixel's channel
-                    pixel[channel] |= int(bits_to_encode, 2)
-                    
-                    # Move to the next bits in the binary text
-                    binary_index += lsb_count
-
-            if binary_index >= binary_len:
-                break  # Stop if the whole message has been encoded
-
-    if binary_index < binary_len:
+def embed_payload(image_array, payload, lsb_count=1, key=None, progress=None):
+    # Hide the payload (container bytes or a PayloadSource) in the R, G, B channels of the
+    # image array, in place. Channels are filled in row-major order (row, pixel, channel),
+    # lsb_count bits each, or along the permutation derived from key when one is given.
+    # Progress is reported in payload bytes, once per block of groups.
+    validate_lsb_count(lsb_count)
+    if image_array.ndim != 3 or image_array.shape[2] < 3:
+        raise ValueError("The cover image must have R, G and B channels.")
+
+    rgb = image_array[..., :3]
+    flat = rgb.reshape(-1)  # A view for RGB images, a copy when there is an alpha channel
+    if group_count(len(payload), lsb_count) > flat.size:
         raise ValueError("The message is too long to be encoded in the image.")
 
+    permutation = carrier_permutation(key, flat.shape) if key is not None else None
+    offset = 0
+    for groups in payload_groups(payload, lsb_count):
+        report(progress, offset * lsb_count // 8, len(payload))
+        with phase('embed'):
+            if key is None:
+                embed_groups(flat, groups, lsb_count, offset)
+            else:
+                scatter_groups(flat, groups, lsb_count, permutation, offset)
+        offset += len(groups)
+    if not np.shares_memory(flat, image_array):
+        rgb[...] = flat.reshape(rgb.shape)
+    return image_array
+
+def image_capacity(image, lsb_count=1):
+    # Usable payload bits, from the image header only (Image.open does not decode pixels).
+    # Every image has R, G and B channels once load_image_array has expanded it.
+    validate_lsb_count(lsb_count)
+    if isinstance(image, np.ndarray):
+        height, width = image.shape[:2]
+    else:
+        with Image.open(as_file(image)) as opened:
+            width, height = opened.size
+    return usable_bits(width * height * 3, lsb_count)
+
+@timed('image', 'encode')
+def encode_image_array(image, payload, lsb_count=1, progress=None, key=None, compression=None):
+    # The stego pixels as a new array. The cover is a path, image bytes, a binary file
+    # object or a pixel array (left unchanged); the payload is a path, bytes or a binary
+    # file object.
+    validate_lsb_count(lsb_count)
+
+    with phase('load'):
+        # Work on the decoded pixels
+        image_array = load_image_array(image)
+
+        # The payload, compressed if asked and wrapped in the length-prefixed container;
+        # it is read a block at a time while it is embedded
+        payload = PayloadSource(payload, compression)
+    with payload:
+        embed_payload(image_array, payload, lsb_count, key, progress)
+        report(progress, len(payload), len(payload))
+    return image_array
+
+@timed('image', 'encode')
+def encode_image_buffer(image, payload, lsb_count=1, progress=None, compress_level=PNG_COMPRESS_LEVEL, key=None,
+                        compression=None):
+    # encode_image without the disk: the stego PNG file as bytes
+    image_array = encode_image_array(image, payload, lsb_count, progress, key, compression)
+    with phase('save'):
+        return image_to_png(image_array, compress_level)
+
+@timed('image', 'encode')
+def encode_image(image_path, payload_file, output_image, lsb_count=1, progress=None,
+                 compress_level=PNG_COMPRESS_LEVEL, key=None, compression=None):
+    # The only file written is the stego PNG, under encoded/ when output_image is a bare file name
+    image_array = encode_image_array(image_path, payload_file, lsb_count, progress, key, compression)
+
     # Save the encoded image
-    original_image_size = os.path.getsize(png_image_path)  # Get original image size
-    encoded_image_path = save_encoded_image(image_array, output_image)  # Save encoded image as PNG
+    with phase('save'):
+        encoded_image_path = save_encoded_image(image_array, output_image, compress_level)  # Save encoded image as PNG
+    original_image_size = os.path.getsize(image_path)  # Get original image size
     encoded_image_size = os.path.getsize(encoded_image_path)  # Get encoded image size
 
-    # Check if the encoded image is smaller than the original
-    if encoded_image_size < original_image_size:
-        print(f"Warning: The encoded image size ({encoded_image_size} bytes) is smaller than the original image size ({original_image_size} bytes).")
-        print("This could indicate unintended compression or data loss.")
+    # Check if the encoded image is smaller than the original (only meaningful for PNG covers,
+    # other formats compress differently)
+    if image_path.lower().endswith('.png') and encoded_image_size < original_image_size:
+        logger.warning("The encoded image size (%d bytes) is smaller than the original image size (%d bytes). "
+                       "This could indicate unintended compression or data loss.", encoded_image_size, original_image_size)
 
-    print(f"Encoded image saved to: {encoded_image_path} ({encoded_image_size} bytes)")
+    logger.info("Encoded image saved to: %s (%d bytes)", encoded_image_path, encoded_image_size)
     return encoded_image_path
 
-def binary_to_text(binary_data):
-    # Convert binary string to text, 8 bits at a time
-    text = ''
-    for i in range(0, len(binary_data), 8):
-        byte = binary_data[i:i+8]
-        text += chr(int(byte, 2))
-    return text
-
-def decode_image(image_path, lsb_count=1):
-    if lsb_count < 1 or lsb_count > 8:
-        raise ValueError("LSB count must be between 1 and 8.")
-    
-    # Convert the input image to PNG if it's not already in PNG format
-    png_image_path = convert_to_png(image_path)
-
-    image = Image.open(png_image_path)
-    image_array = np.array(image)
-
-    binary_data = ""
-    end_marker = "###END###"
-    binary_end_marker = text_to_binary(end_marker)
-
-    for row in image_array:
-        for pixel in row:
-            for channel in range(3):  # R, G, B channels
-                # Extract the least significant bits from the channel value
-                bits_from_channel = format(pixel[channel], '08b')[-lsb_count:]
-                
-                # Append the bits to the binary data string
-                binary_data += bits_from_channel
-                
-                # Check if we've reached the end of the marker
-                if len(binary_data) >= len(binary_end_marker):
-                    decoded_text = binary_to_text(binary_data)
-                    if end_marker in decoded_text:
-                        return decoded_text[:decoded_text.index(end_marker)]
-
-    # If no end marker is found, return the decoded text up to the marker
-    return binary_to_text(binary_data)
+def map_bmp_pixels(bmp_path, mode='r'):
+    # Memory-map the pixel array of an uncompressed 24 or 32-bit BMP and return a view with
+    # the same (row, column, channel) layout as np.array(Image.open(...))[..., :3]: rows top
+    # to bottom and channels in R, G, B order. On disk rows are stored bottom-up (for a
+    # positive height), padded to a multiple of 4 bytes, with channels in B, G, R(, X) order;
+    # the view undoes all of that with strides, so nothing is read until it is indexed.
+    with open(bmp_path, 'rb') as file:
+        header = file.read(BMP_FILE_HEADER.size + BMP_INFO_HEADER.size)
+    if len(header) < BMP_FILE_HEADER.size + BMP_INFO_HEADER.size:
+        raise ValueError("The file is too short to be a BMP image.")
+    signature, _, _, _, pixel_offset = BMP_FILE_HEADER.unpack_from(header)
+    _, width, height, _, bits_per_pixel, compression = BMP_INFO_HEADER.unpack_from(header, BMP_FILE_HEADER.size)
+    if signature != b'BM':
+        raise ValueError("The file is not a BMP image.")
+    if compression != BI_RGB or bits_per_pixel not in (24, 32):
+        raise ValueError("Only uncompressed 24 and 32-bit BMP images can be memory-mapped.")
+
+    bytes_per_pixel = bits_per_pixel // 8
+    stride = (width * bits_per_pixel + 31) // 32 * 4
+    rows = np.memmap(bmp_path, dtype=np.uint8, mode=mode, offset=pixel_offset, shape=(abs(height), stride))
+    pixels = rows[:, :width * bytes_per_pixel].reshape(abs(height), width, bytes_per_pixel)
+    if height > 0:
+        pixels = pixels[::-1]
+    return rows, pixels[..., 2::-1]
+
+@timed('image', 'encode')
+def encode_bmp_mapped(bmp_path, payload_file, output_path=None, lsb_count=1, progress=None, key=None,
+                      compression=None):
+    # Encode into the BMP itself (output_path None) or into a copy of it, touching only the
+    # rows that carry the payload. The result decodes with decode_image_bytes like any stego
+    # image, and costs about as much as the payload however large the cover is.
+    validate_lsb_count(lsb_count)
+    with phase('load'):
+        _, rgb = map_bmp_pixels(bmp_path)
+        payload = PayloadSource(payload_file, compression)
+    with payload:
+        if group_count(len(payload), lsb_count) > rgb.size:
+            raise ValueError("The message is too long to be encoded in the image.")
+        report(progress, 0, len(payload))
+
+        with phase('copy'):
+            output_path = copy_cover(bmp_path, output_path)
+        rows, rgb = map_bmp_pixels(output_path, 'r+')
+        stream = payload.groups(lsb_count)
+
+        if key is None:
+            # Only the leading rows of the view carry the payload; patch them through the map
+            # a block of rows at a time
+            rows_per_chunk = max(1, STREAM_CHUNK_GROUPS // (rgb.shape[1] * 3))
+            for row in range(0, rgb.shape[0], rows_per_chunk):
+                block = rgb[row:row + rows_per_chunk]
+                groups = stream.take(block.size)
+                if not len(groups):
+                    break
+                report(progress, row * rgb.shape[1] * 3 * lsb_count // 8, len(payload))
+                with phase('embed'):
+                    flat = np.ascontiguousarray(block).reshape(-1)
+                    embed_groups(flat, groups, lsb_count)
+                    block[...] = flat.reshape(block.shape)
+        else:
+            # Same positions as embed_payload's keyed mode, patched one value at a time through the map
+            permutation = carrier_permutation(key, (rgb.size,))
+            keep_mask = np.uint8(0xFF ^ ((1 << lsb_count) - 1))
+            offset = 0
+            for groups in stream:
+                report(progress, offset * lsb_count // 8, len(payload))
+                with phase('embed'):
+                    positions = np.unravel_index(permutation[offset:offset + len(groups)], rgb.shape)
+                    rgb[positions] = (rgb[positions] & keep_mask) | groups
+                offset += len(groups)
+        with phase('save'):
+            rows.flush()
+        report(progress, len(payload), len(payload))
+
+    logger.info("Encoded image saved to: %s", output_path)
+    return output_path
+
+def iter_image_bytes(rgb, lsb_count, progress=None):
+    # Yield the bytes hidden in the R, G, B channels, extracting a block of rows at a time
+    # so the caller can stop reading pixels as soon as it has what it needs
+    reader = BitReader(lsb_count)
+    rows_per_chunk = max(1, DECODE_CHUNK_CHANNELS // (rgb.shape[1] * 3))
+    for row in range(0, rgb.shape[0], rows_per_chunk):
+        report(progress, row, rgb.shape[0])
+        yield reader.feed(rgb[row:row + rows_per_chunk].reshape(-1))
+
+@timed('image', 'decode')
+@cached_decode
+def decode_image_bytes(image, lsb_count=1, progress=None, key=None):
+    # The payload hidden in an image given as a path, image bytes, a binary file object or
+    # a pixel array
+    validate_lsb_count(lsb_count)
+
+    with phase('load'):
+        try:
+            # Uncompressed BMP files are read straight from a memory map, a block of rows at a time
+            if not is_path(image):
+                raise ValueError("Only files can be memory-mapped.")
+            _, rgb = map_bmp_pixels(image)
+        except ValueError:
+            image_array = load_image_array(image) if not isinstance(image, np.ndarray) else image
+            if image_array.ndim != 3 or image_array.shape[2] < 3:
+                raise ValueError("The stego image must have R, G and B channels.")
+            rgb = image_array[..., :3]
+
+    if key is not None:
+        # Keyed images always hold a container, read along the key's permutation
+        with phase('unpack'):
+            carrier = np.ascontiguousarray(rgb).reshape(-1)
+            permutation = carrier_permutation(key, carrier.shape)
+            payload = unpack_stream(iter_scattered_bytes(carrier, lsb_count, permutation, DECODE_CHUNK_CHANNELS))
+        if payload is None:
+            raise PayloadError("No payload found with this key.")
+        report(progress, rgb.shape[0], rgb.shape[0])
+        return payload
+
+    # Read the container header, then exactly as many bytes as it declares
+    with phase('unpack'):
+        payload = unpack_stream(iter_image_bytes(rgb, lsb_count, progress))
+        if payload is None:
+            # Images encoded before the container format end with a text marker instead
+            payload = read_until_marker(iter_image_bytes(rgb, lsb_count, progress), END_MARKER)
+    report(progress, rgb.shape[0], rgb.shape[0])
+    return payload
+
+def decode_image(image, lsb_count=1, progress=None, key=None):
+    return payload_to_text(decode_image_bytes(image, lsb_count, progress, key))
 '''
 # TESTING CODE
 # Encode the text file into the image
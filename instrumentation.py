@@ -0,0 +1,138 @@
+import bisect
+import contextlib
+import contextvars
+import functools
+import logging
+import threading
+import time
+from collections import defaultdict
+from progress import OperationCancelled
+
+# Timing instrumentation shared by the codecs. Every encode or decode runs under a Timer,
+# which adds up the time spent in each phase and emits one event per phase when the
+# operation ends:
+#   {'codec': 'audio', 'operation': 'encode', 'phase': 'embed', 'seconds': 0.0123,
+#    'calls': 4, 'status': 'ok'}
+# Phases: load (reading the cover, sizing the payload), pack (reading payload blocks into
+# lsb groups), embed, save, copy (mapped encoders), extract (decoding video frames or
+# carrier values), remux (writing through ffmpeg), unpack (reading the container back) and
+# cache (hashing the carrier and reading or writing the decode cache).
+# A 'total' event covers the whole operation; status is 'error' or 'cancelled' if it did
+# not finish.
+#
+# Events go to every hook registered with add_timing_hook and are logged at DEBUG level on
+# the 'steganography.timing' logger, with the event attached as record.timing.
+#
+# Helpers mark their steps with phase(name), which is timed against the Timer of the
+# operation that called them and does nothing when there is none. Steps that run in another
+# process measure themselves and are added with add_phase_time in the calling process.
+
+logger = logging.getLogger('steganography.timing')
+
+# Upper bounds (seconds) of the latency_histogram buckets; the last bucket is unbounded
+LATENCY_BUCKETS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 30, 60]
+
+_hooks = []
+_hooks_lock = threading.Lock()
+_current_timer = contextvars.ContextVar('current_timer', default=None)
+
+def add_timing_hook(hook):
+    with _hooks_lock:
+        _hooks.append(hook)
+
+def remove_timing_hook(hook):
+    with _hooks_lock:
+        _hooks.remove(hook)
+
+def emit(event):
+    with _hooks_lock:
+        hooks = list(_hooks)
+    for hook in hooks:
+        hook(event)
+    logger.debug("%s %s %s %.6fs", event['codec'], event['operation'], event['phase'],
+                 event['seconds'], extra={'timing': event})
+
+def phase(name):
+    timer = _current_timer.get()
+    return timer.phase(name) if timer is not None else contextlib.nullcontext()
+
+def add_phase_time(name, seconds):
+    # Count time measured somewhere without a Timer (a worker process, say) as one call of
+    # a phase of the current operation; does nothing when there is none
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.seconds[name] += seconds
+        timer.calls[name] += 1
+
+def timed(codec, operation):
+    # Decorator running the whole function under a Timer. Called from inside another timed
+    # function (a path wrapper around an in-memory encoder, say), it runs under the caller's
+    # Timer instead, so one operation still reports one set of events.
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_timer.get() is not None:
+                return func(*args, **kwargs)
+            with Timer(codec, operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class Timer:
+    # Used as `with Timer('image', 'encode'):` (or the timed decorator) around a whole
+    # operation, and `with phase('embed'):` around each step. A phase may be entered many
+    # times (once per chunk or frame); its time is added up and reported once.
+    def __init__(self, codec, operation):
+        self.codec = codec
+        self.operation = operation
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+            self.calls[name] += 1
+
+    def __enter__(self):
+        self.token = _current_timer.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        total = time.perf_counter() - self.start
+        _current_timer.reset(self.token)
+        if exc_type is None:
+            status = 'ok'
+        elif issubclass(exc_type, OperationCancelled):
+            status = 'cancelled'
+        else:
+            status = 'error'
+        for name, seconds in list(self.seconds.items()) + [('total', total)]:
+            emit({'codec': self.codec, 'operation': self.operation, 'phase': name,
+                  'seconds': seconds, 'calls': self.calls.get(name, 1), 'status': status})
+        return False
+
+def latency_histogram(durations):
+    # Summary of a list of phase durations (seconds) for job runners: count, total,
+    # percentiles and a count per LATENCY_BUCKETS bucket ('le_<bound>' or 'le_inf')
+    durations = sorted(durations)
+    counts = [0] * (len(LATENCY_BUCKETS) + 1)
+    for seconds in durations:
+        counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    labels = [f'le_{bound:g}' for bound in LATENCY_BUCKETS] + ['le_inf']
+
+    def percentile(fraction):
+        return durations[min(len(durations) - 1, int(fraction * len(durations)))] if durations else 0.0
+
+    return {
+        'count': len(durations),
+        'total': sum(durations),
+        'p50': percentile(0.5),
+        'p95': percentile(0.95),
+        'max': durations[-1] if durations else 0.0,
+        'buckets': dict(zip(labels, counts)),
+    }
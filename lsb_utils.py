@@ -0,0 +1,112 @@
+import os
+import shutil
+import numpy as np
+from instrumentation import phase
+
+def validate_lsb_count(lsb_count):
+    if lsb_count < 1 or lsb_count > 8:
+        raise ValueError("LSB count must be between 1 and 8.")
+
+def text_to_bytes(text):
+    # One byte per character, matching the format(ord(char), '08b') encoding of the text codecs
+    try:
+        return text.encode('latin-1')
+    except UnicodeEncodeError:
+        raise ValueError("The message contains characters that cannot be stored in 8 bits.")
+
+def copy_cover(cover_path, output_path=None):
+    # Output file for the memory-mapped encoders: the cover itself when output_path is None
+    # (in-place), otherwise a plain file copy that is then patched where the payload goes
+    if output_path is None or os.path.abspath(output_path) == os.path.abspath(cover_path):
+        return cover_path
+    shutil.copyfile(cover_path, output_path)
+    return output_path
+
+def bytes_to_bits(data):
+    # Unpack a bytes-like payload into a flat array of 0/1 values, most significant bit first
+    return np.unpackbits(np.frombuffer(data, dtype=np.uint8))
+
+def group_count(byte_count, lsb_count):
+    # lsb_count-bit values needed to hold byte_count bytes
+    return -(-byte_count * 8 // lsb_count)
+
+def bits_to_groups(bits, lsb_count):
+    # Pack a flat bit array into lsb_count-wide values, zero padding the last group
+    # (the same as ljust(lsb_count, '0') on the final slice of a '0101...' string)
+    pad = -len(bits) % lsb_count
+    if pad:
+        bits = np.concatenate((bits, np.zeros(pad, dtype=np.uint8)))
+    groups = bits.reshape(-1, lsb_count)
+
+    # Shift the columns in one at a time: lsb_count whole-array passes instead of a Python loop
+    values = groups[:, 0].copy()
+    for column in range(1, lsb_count):
+        values <<= 1
+        values |= groups[:, column]
+    return values
+
+# Values handed out per step when a GroupStream is iterated
+STREAM_CHUNK_GROUPS = 1 << 20
+
+class GroupStream:
+    # bits_to_groups over a stream of payload byte blocks: blocks are unpacked only as the
+    # values are asked for, and bits left over from a block are carried over to the next,
+    # so memory follows the request size rather than the payload size. Only the very last
+    # value is zero padded.
+    def __init__(self, byte_blocks, lsb_count):
+        validate_lsb_count(lsb_count)
+        self.byte_blocks = iter(byte_blocks)
+        self.lsb_count = lsb_count
+        self.pending = np.zeros(0, dtype=np.uint8)
+
+    def take(self, count):
+        # The next count values, fewer once the payload runs out (empty at the end). Timed
+        # as the 'pack' phase, which includes reading the payload blocks.
+        needed = count * self.lsb_count
+        with phase('pack'):
+            parts = [self.pending]
+            available = len(self.pending)
+            while available < needed:
+                block = next(self.byte_blocks, None)
+                if block is None:
+                    break
+                parts.append(bytes_to_bits(block))
+                available += len(parts[-1])
+            bits = np.concatenate(parts) if len(parts) > 1 else parts[0]
+            self.pending = bits[needed:]
+            return bits_to_groups(bits[:needed], self.lsb_count)
+
+    def __iter__(self):
+        while True:
+            groups = self.take(STREAM_CHUNK_GROUPS)
+            if not len(groups):
+                return
+            yield groups
+
+def embed_groups(carrier, groups, lsb_count, offset=0):
+    # Write the values into the low lsb_count bits of a flat uint8 carrier, in place
+    keep_mask = np.uint8(0xFF ^ ((1 << lsb_count) - 1))
+    end = offset + len(groups)
+    carrier[offset:end] = (carrier[offset:end] & keep_mask) | groups
+
+def groups_to_bits(values, lsb_count):
+    # Expand the low lsb_count bits of every value into a flat 0/1 array, most significant first
+    bits = np.unpackbits(np.asarray(values, dtype=np.uint8)).reshape(-1, 8)
+    return bits[:, 8 - lsb_count:].reshape(-1)
+
+class BitReader:
+    # Turns a stream of carrier chunks into payload bytes. Bits that do not fill a whole
+    # byte yet are carried over to the next chunk, so chunk boundaries can fall anywhere.
+    def __init__(self, lsb_count):
+        validate_lsb_count(lsb_count)
+        self.lsb_count = lsb_count
+        self.mask = np.uint8((1 << lsb_count) - 1)
+        self.pending = np.zeros(0, dtype=np.uint8)
+
+    def feed(self, carrier_chunk):
+        bits = groups_to_bits(carrier_chunk & self.mask, self.lsb_count)
+        if len(self.pending):
+            bits = np.concatenate((self.pending, bits))
+        whole = len(bits) - len(bits) % 8
+        self.pending = bits[whole:]
+        return np.packbits(bits[:whole]).tobytes()
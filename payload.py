@@ -0,0 +1,253 @@
+import io
+import lzma
+import os
+import struct
+import tempfile
+import zlib
+from lsb_utils import GroupStream
+from buffers import is_buffer, is_path
+from codec_registry import COMPRESSION_IDS
+
+try:
+    import zstandard
+except ImportError:  # zstd compression is only available with the zstandard package
+    zstandard = None
+
+DECOMPRESSION_ERRORS = (zlib.error, lzma.LZMAError) + ((zstandard.ZstdError,) if zstandard else ())
+
+# Every codec embeds the payload inside the same container:
+#   magic (4 bytes) | version (1) | flags (1) | payload length (8) | CRC-32 of the payload (4) | payload
+# Decoders read the header, then exactly `length` more bytes, so no end marker has to be
+# searched for. The first magic byte is not ASCII, so text hidden by the older
+# marker-terminated formats is never mistaken for a container.
+#
+# The low four bits of flags name the compression applied to the stored payload (0 for
+# none); length and CRC describe the stored bytes, so damage is caught before
+# decompressing. Compression is chosen per job and only kept when it makes the payload
+# smaller.
+MAGIC = b'\x89STG'
+VERSION = 1
+HEADER = struct.Struct('>4sBBQI')
+
+COMPRESSION_MASK = 0x0F
+COMPRESSION_NAMES = {value: name for name, value in COMPRESSION_IDS.items()}
+
+# Bytes read from the payload file per step by the encoders
+PAYLOAD_BLOCK_SIZE = 1 << 20
+
+class PayloadError(ValueError):
+    pass
+
+def compressor(compression, size):
+    # Incremental compressor (compress/flush) for a payload of size bytes. zstd records the
+    # size in the frame header, which ZstdDecompressor.decompress needs.
+    if compression == 'zlib':
+        return zlib.compressobj(9)
+    if compression == 'lzma':
+        return lzma.LZMACompressor()
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package.")
+        return zstandard.ZstdCompressor(level=19).compressobj(size=size)
+    raise ValueError(f"Unknown compression: {compression}")
+
+def decompress(flags, data):
+    compression = COMPRESSION_NAMES.get(flags & COMPRESSION_MASK)
+    if not flags & COMPRESSION_MASK:
+        return data
+    try:
+        if compression == 'zlib':
+            return zlib.decompress(data)
+        if compression == 'lzma':
+            return lzma.decompress(data)
+        if compression == 'zstd' and zstandard is not None:
+            return zstandard.ZstdDecompressor().decompress(data)
+    except DECOMPRESSION_ERRORS as e:
+        raise PayloadError(f"The payload could not be decompressed: {e}")
+    if compression == 'zstd':
+        raise PayloadError("The payload is zstd-compressed; install the zstandard package to read it.")
+    raise PayloadError(f"Unsupported payload compression {flags & COMPRESSION_MASK}.")
+
+class PayloadSource:
+    # The container for a payload, produced a block at a time so the encoders use the same
+    # memory whatever the payload size:
+    #     with PayloadSource(payload, compression) as source:
+    #         len(source)                  # container size in bytes
+    #         stream = source.groups(lsb_count)
+    #         stream.take(count)           # the next count lsb_count-bit values
+    # The payload is a path, the payload bytes, or a binary file object (read from its
+    # current position to the end; it must be seekable). It is read once up front for the
+    # CRC, or compressed (into memory for bytes, otherwise into a temporary file, kept only
+    # if it is smaller than the original), and again while embedding.
+    def __init__(self, payload, compression=None, block_size=PAYLOAD_BLOCK_SIZE):
+        self.payload = payload
+        self.block_size = block_size
+        self.stored = None
+        self.start = 0
+        if is_buffer(payload):
+            self.payload = memoryview(payload).cast('B')
+            size = len(self.payload)
+        elif is_path(payload):
+            size = os.path.getsize(payload)
+        else:
+            self.start = payload.tell()
+            size = payload.seek(0, os.SEEK_END) - self.start
+        flags = 0
+        if compression:
+            stored, stored_size, crc = self.compress_payload(compression, size)
+            if stored_size < size:
+                self.stored, flags, size = stored, COMPRESSION_IDS[compression], stored_size
+            else:
+                stored.close()
+        if self.stored is None:
+            crc = 0
+            for block in self.read_blocks(size):
+                crc = zlib.crc32(block, crc)
+        self.size = size
+        self.header = HEADER.pack(MAGIC, VERSION, flags, size, crc)
+
+    def compress_payload(self, compression, size):
+        # (file, size, CRC) of the compressed payload
+        stream = compressor(compression, size)
+        stored = io.BytesIO() if isinstance(self.payload, memoryview) else tempfile.TemporaryFile()
+        crc = 0
+        try:
+            for block in self.read_blocks(size):
+                data = stream.compress(block)
+                stored.write(data)
+                crc = zlib.crc32(data, crc)
+            data = stream.flush()
+            stored.write(data)
+            crc = zlib.crc32(data, crc)
+            return stored, stored.tell(), crc
+        except BaseException:
+            stored.close()
+            raise
+
+    def read_blocks(self, size):
+        # The first size bytes of the payload, or of the compressed copy once there is one
+        if self.stored is None and isinstance(self.payload, memoryview):
+            for start in range(0, size, self.block_size):
+                yield self.payload[start:min(start + self.block_size, size)]
+            return
+        if self.stored is not None:
+            file, start = self.stored, 0
+        elif is_path(self.payload):
+            file, start = open(self.payload, 'rb'), 0
+        else:
+            file, start = self.payload, self.start
+        try:
+            file.seek(start)
+            while size > 0:
+                block = file.read(min(self.block_size, size))
+                if not block:
+                    raise IOError("The payload shrank while it was being read.")
+                size -= len(block)
+                yield block
+        finally:
+            if file is not self.stored and file is not self.payload:
+                file.close()
+
+    def blocks(self):
+        # The whole container: header, then the stored payload
+        yield self.header
+        yield from self.read_blocks(self.size)
+
+    def groups(self, lsb_count):
+        return GroupStream(self.blocks(), lsb_count)
+
+    def __len__(self):
+        return HEADER.size + self.size
+
+    def close(self):
+        if self.stored is not None:
+            self.stored.close()
+            self.stored = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+def payload_groups(payload, lsb_count):
+    # GroupStream over a PayloadSource, or over a container already in memory (unpacked a
+    # block at a time as well)
+    if isinstance(payload, PayloadSource):
+        return payload.groups(lsb_count)
+    view = memoryview(payload)
+    return GroupStream((view[start:start + PAYLOAD_BLOCK_SIZE] for start in range(0, len(view), PAYLOAD_BLOCK_SIZE)),
+                       lsb_count)
+
+def usable_bits(carrier_values, lsb_count, overhead_bytes=0):
+    # Payload bits that fit in carrier_values values of lsb_count bits each, once the
+    # container header (and any codec header) is taken out; payloads are whole bytes
+    payload_bytes = carrier_values * lsb_count // 8 - HEADER.size - overhead_bytes
+    return max(0, payload_bytes) * 8
+
+def parse_header(header_bytes):
+    # Returns (flags, length, crc), or None if the bytes do not start with a container
+    if len(header_bytes) < HEADER.size:
+        return None
+    magic, version, flags, length, crc = HEADER.unpack(bytes(header_bytes[:HEADER.size]))
+    if magic != MAGIC:
+        return None
+    if version != VERSION:
+        raise PayloadError(f"Unsupported payload version {version}.")
+    return flags, length, crc
+
+def check_payload(data, crc):
+    if zlib.crc32(data) != crc:
+        raise PayloadError("The payload checksum does not match; the carrier is damaged or the settings are wrong.")
+    return data
+
+def open_payload(header, data):
+    # The original payload from the stored bytes a header describes
+    flags, _, crc = header
+    return decompress(flags, check_payload(data, crc))
+
+def unpack_stream(byte_chunks):
+    # Read a container from an iterator of decoded carrier bytes, pulling only as many
+    # chunks as the header says are needed. Returns None if there is no container header.
+    byte_chunks = iter(byte_chunks)
+    buffer = bytearray()
+    for chunk in byte_chunks:
+        buffer += chunk
+        if len(buffer) >= HEADER.size:
+            break
+    header = parse_header(buffer)
+    if header is None:
+        return None
+
+    _, length, _ = header
+    end = HEADER.size + length
+    if len(buffer) < end:
+        for chunk in byte_chunks:
+            buffer += chunk
+            if len(buffer) >= end:
+                break
+    if len(buffer) < end:
+        raise PayloadError("The carrier ended before the whole payload was read.")
+    return open_payload(header, bytes(buffer[HEADER.size:end]))
+
+def payload_to_text(data):
+    # For display: UTF-8 when the payload is valid UTF-8, otherwise one character per byte
+    # (which is also how payloads hidden by the older text-only formats were stored)
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('latin-1')
+
+def read_until_marker(byte_chunks, end_marker):
+    # Legacy formats: collect decoded bytes until end_marker, searching only the new bytes
+    # of each chunk plus an overlap for a marker split across chunks. Everything decoded
+    # is returned if the marker never shows up.
+    decoded = bytearray()
+    for chunk in byte_chunks:
+        search_from = max(0, len(decoded) - len(end_marker) + 1)
+        decoded += chunk
+        marker_index = decoded.find(end_marker, search_from)
+        if marker_index != -1:
+            return bytes(decoded[:marker_index])
+    return bytes(decoded)
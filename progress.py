@@ -0,0 +1,11 @@
+# Progress reporting shared by the codecs. A progress callback is called as
+# progress(done, total) with the amount of work processed so far (frames, rows or bytes,
+# whatever the codec works in). The callback may raise OperationCancelled to stop the job;
+# codecs let it propagate and clean up any partial output.
+
+class OperationCancelled(Exception):
+    pass
+
+def report(progress, done, total):
+    if progress is not None:
+        progress(done, total)
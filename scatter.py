@@ -0,0 +1,167 @@
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from lsb_utils import BitReader
+
+# Keyed mode: instead of filling the carrier from the first value onwards, the payload is
+# embedded along a pseudo-random permutation of the carrier positions derived from a key,
+# so the changes are spread over the whole image, recording or frame.
+#
+# The permutation is a keyed Feistel network over the carrier's index range, evaluated only
+# for the payload values being embedded or read: permutation[a:b] is the carrier positions
+# of values a to b-1. Nothing the size of the carrier is ever built, so a keyed job costs
+# time and memory in proportion to its payload, like an unkeyed one. Evaluated positions
+# are cached a block at a time per (key, carrier size), so repeated jobs on same-sized
+# carriers with the same key only pay for the gather and scatter.
+#
+# The round keys are raw PCG64 output seeded from a SHA-256 of the key. Only the bit
+# generator's raw stream is guaranteed to stay the same across NumPy releases, and stego
+# files must keep decoding after an upgrade.
+
+FEISTEL_ROUNDS = 6
+
+# Values run through the network per step, small enough for the temporaries to stay in cache
+FEISTEL_CHUNK_VALUES = 1 << 16
+
+# Permutation objects kept for reuse, one per (key, shape) pair; each holds only its round keys
+PERMUTATION_CACHE_SIZE = 16
+
+# Evaluated positions are cached in blocks of POSITION_BLOCK_VALUES values (8 bytes each),
+# shared by all permutations; the least recently used blocks are dropped once they take
+# more than POSITION_CACHE_BYTES
+POSITION_BLOCK_VALUES = 1 << 18
+POSITION_CACHE_BYTES = 256 << 20
+
+_position_blocks = OrderedDict()
+_position_bytes = 0
+_position_lock = threading.Lock()
+
+# Position arrays kept by leading_positions, 8 bytes per payload value each
+POSITIONS_CACHE_SIZE = 2
+
+def key_seed(key):
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    if not key:
+        raise ValueError("The key must not be empty.")
+    return int.from_bytes(hashlib.sha256(key).digest(), 'big')
+
+class KeyedPermutation:
+    # A permutation of range(size) that can be sliced like an index array. Values are
+    # split into a high and a low half (of different widths when the bit count is odd)
+    # and run through FEISTEL_ROUNDS rounds over the smallest power of two covering size;
+    # results that land past the end are encrypted again until they fall inside (cycle
+    # walking), which keeps the mapping a permutation of range(size). The round function
+    # is the top bits of (half ^ a) * b for a per-round key a and odd multiplier b, in
+    # 32-bit words for carriers of up to 2**32 values (all of them, in practice).
+    # Slices come from the block cache and may be read-only views into it.
+    def __init__(self, key, size):
+        self.size = size
+        self.seed = key_seed(key)
+        bits = max(2, (size - 1).bit_length())
+        self.high_bits = bits // 2
+        self.low_bits = bits - self.high_bits
+        self.dtype = np.uint32 if bits <= 32 else np.uint64
+        self.word_bits = np.dtype(self.dtype).itemsize * 8
+        raw = np.random.PCG64(self.seed).random_raw(2 * FEISTEL_ROUNDS).astype(self.dtype)
+        self.round_keys = list(zip(raw[:FEISTEL_ROUNDS], raw[FEISTEL_ROUNDS:] | self.dtype(1)))
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError("Keyed permutations can only be sliced.")
+        start, stop, step = index.indices(self.size)
+        if step != 1:
+            return self.positions(np.arange(start, stop, step, dtype=self.dtype))
+        if stop <= start:
+            return np.empty(0, dtype=np.intp)
+        pieces = []
+        for number in range(start // POSITION_BLOCK_VALUES, (stop - 1) // POSITION_BLOCK_VALUES + 1):
+            block_start = number * POSITION_BLOCK_VALUES
+            pieces.append(self.block(number)[max(start - block_start, 0):stop - block_start])
+        return pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
+
+    def block(self, number):
+        # Positions of values number * POSITION_BLOCK_VALUES onwards, from the cache or
+        # evaluated and added to it
+        global _position_bytes
+        cache_key = (self.seed, self.size, number)
+        with _position_lock:
+            block = _position_blocks.get(cache_key)
+            if block is not None:
+                _position_blocks.move_to_end(cache_key)
+                return block
+        start = number * POSITION_BLOCK_VALUES
+        block = self.positions(np.arange(start, min(start + POSITION_BLOCK_VALUES, self.size), dtype=self.dtype))
+        block.flags.writeable = False
+        with _position_lock:
+            if cache_key not in _position_blocks:
+                _position_blocks[cache_key] = block
+                _position_bytes += block.nbytes
+            while _position_bytes > POSITION_CACHE_BYTES and _position_blocks:
+                _, dropped = _position_blocks.popitem(last=False)
+                _position_bytes -= dropped.nbytes
+        return block
+
+    def positions(self, indices):
+        # Carrier positions of the given payload value indices
+        result = np.empty(len(indices), dtype=np.intp)
+        for start in range(0, len(indices), FEISTEL_CHUNK_VALUES):
+            chunk = self.encrypt(indices[start:start + FEISTEL_CHUNK_VALUES])
+            outside = np.flatnonzero(chunk >= self.size)
+            while len(outside):
+                chunk[outside] = self.encrypt(chunk[outside])
+                outside = outside[chunk[outside] >= self.size]
+            result[start:start + len(chunk)] = chunk
+        return result
+
+    def encrypt(self, values):
+        word = self.dtype
+        left_bits, right_bits = self.high_bits, self.low_bits
+        left = values >> word(right_bits)
+        right = values & word((1 << right_bits) - 1)
+        for xor_key, multiplier in self.round_keys:
+            mixed = right ^ xor_key
+            mixed *= multiplier
+            mixed >>= word(self.word_bits - left_bits)
+            mixed ^= left
+            left, right = right, mixed
+            left_bits, right_bits = right_bits, left_bits
+        left <<= word(right_bits)
+        left |= right
+        return left
+
+@functools.lru_cache(maxsize=PERMUTATION_CACHE_SIZE)
+def carrier_permutation(key, shape):
+    # Carrier positions (flat indices into an array of this shape) in embedding order
+    return KeyedPermutation(key, int(np.prod(shape)))
+
+@functools.lru_cache(maxsize=POSITIONS_CACHE_SIZE)
+def leading_positions(key, shape, count):
+    # carrier_permutation(key, shape)[:count] as a read-only array, for callers that use the
+    # same positions over and over (every frame of a spread-mode video)
+    positions = carrier_permutation(key, shape)[:count]
+    positions.flags.writeable = False
+    return positions
+
+def scatter_groups(carrier, groups, lsb_count, permutation, offset=0):
+    # embed_groups along the permutation (or an array of positions): one gather and one
+    # scatter over a flat uint8 carrier, starting offset values into the permutation
+    positions = permutation[offset:offset + len(groups)]
+    keep_mask = np.uint8(0xFF ^ ((1 << lsb_count) - 1))
+    carrier[positions] = (carrier[positions] & keep_mask) | groups
+
+def gather_groups(carrier, count, lsb_count, permutation):
+    # The low lsb_count bits of the first count carrier values along the permutation
+    return carrier[permutation[:count]] & np.uint8((1 << lsb_count) - 1)
+
+def iter_scattered_bytes(carrier, lsb_count, permutation, chunk_values):
+    # Decoded payload bytes along the permutation, chunk_values carrier values at a time,
+    # so a container reader can stop as soon as it has the whole payload
+    reader = BitReader(lsb_count)
+    for start in range(0, len(permutation), chunk_values):
+        yield reader.feed(carrier[permutation[start:start + chunk_values]])
@@ -1,20 +1,35 @@
 import tkinter as tk
 from tkinterdnd2 import TkinterDnD, DND_FILES
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
 from PIL import Image, ImageTk
-from audio_steganography import encode_audio_lsb, decode_audio_lsb
-from image_steganography import encode_image, decode_image
-from video_steganography import encode_video, decode_video
-from tkVideoPlayer import TkinterVideo
-import cv2
+from codec_registry import CODECS, codec_for, is_supported
+from capacity import probe_capacity
+import argparse
+import logging
+import os
+import queue
+import threading
+from progress import OperationCancelled
+from decode_cache import enable_decode_cache, DEFAULT_CACHE_BYTES
 
 # Global variables for bit sizes
 cover_bits = 0
 payload_bits = 0
 
 # Global variables for file types
-ACCEPTABLE_COVER_EXTENSIONS = ['.txt', '.png', '.bmp', '.wav', '.mp4', '.avi']
-ACCEPTABLE_PAYLOAD_EXTENSIONS = ['.txt']
+ACCEPTABLE_COVER_EXTENSIONS = [extension for codec in CODECS.values() for extension in codec.extensions]
+
+# How often the window checks on a running encode/decode job
+WORKER_POLL_MS = 100
+
+def cover_kind(path):
+    # 'image', 'audio', 'video' or 'text', or None for an unsupported file
+    return codec_for(path).name if is_supported(path) else None
+
+def new_video_player(parent):
+    # tkVideoPlayer (and PyAV behind it) is only imported once a video is shown
+    from tkVideoPlayer import TkinterVideo
+    return TkinterVideo(parent, scaled=True)
 
 class ScrollableFrame(tk.Frame):
     def __init__(self, parent, bg_color, *args, **kwargs):
@@ -72,7 +87,7 @@ class SteganographyApp:
 
         # Payload Object
         self.payload_label = tk.Label(
-            self.frame, text="Payload (Text):",
+            self.frame, text="Payload (Any File):",
             bg="#ffffff", font=("Arial", 12))
         self.payload_label.grid(row=1, column=0, padx=10)
 
@@ -106,6 +121,24 @@ class SteganographyApp:
             bg="#2196F3", fg="white", font=("Arial", 12))
         self.decode_button.grid(row=3, column=1, pady=20)
 
+        # Progress of the running encode/decode job (initially hidden)
+        self.progress_frame = tk.Frame(self.frame, bg="#ffffff")
+        self.progress_frame.grid(row=6, column=0, columnspan=3, pady=5)
+        self.status_label = tk.Label(
+            self.progress_frame, text="", bg="#ffffff", font=("Arial", 12))
+        self.status_label.pack(side="left", padx=10)
+        self.progress_bar = ttk.Progressbar(
+            self.progress_frame, orient="horizontal", length=300)
+        self.progress_bar.pack(side="left", padx=10)
+        self.cancel_button = tk.Button(
+            self.progress_frame, text="Cancel", command=self.cancel_operation,
+            bg="#f44336", fg="white", font=("Arial", 12))
+        self.cancel_button.pack(side="left", padx=10)
+        self.progress_frame.grid_remove()
+        self.worker = None
+        self.worker_events = None
+        self.cancel_event = None
+
         # Frame for displaying original cover object (initially hidden)
         self.original_frame = tk.Frame(
             main_frame, bg="#e0e0e0", padx=10, pady=10)
@@ -117,11 +150,9 @@ class SteganographyApp:
             self.original_frame, bg="#ffffff", borderwidth=2, relief="solid")
         self.cover_display.pack(padx=10, pady=10)
 
-        # Video player placeholder for videos
-        self.video_player = TkinterVideo(
-            self.original_frame, scaled=True)
-        self.video_player.pack(expand=True, fill="both")
-        self.video_player.pack_forget()  # Hide it initially
+        # Video player for video covers, created the first time one is shown (importing
+        # tkVideoPlayer pulls in PyAV, which would slow down every start)
+        self.video_player = None
 
         # Comparison Frame (initially hidden)
         self.comparison_frame = tk.Frame(
@@ -146,7 +177,7 @@ class SteganographyApp:
 
     def on_drop_cover(self, event):
         self.cover_file_path = self.clean_file_path(event.data)
-        if not self.cover_file_path.lower().endswith(tuple(ACCEPTABLE_COVER_EXTENSIONS)):
+        if not is_supported(self.cover_file_path):
             messagebox.showerror(
                 "Error", "Unsupported file type selected for cover object.")
             self.cover_file_path = None
@@ -158,9 +189,9 @@ class SteganographyApp:
 
     def on_drop_payload(self, event):
         self.payload_file_path = self.clean_file_path(event.data)
-        if not self.payload_file_path.lower().endswith(tuple(ACCEPTABLE_PAYLOAD_EXTENSIONS)):
+        if not os.path.isfile(self.payload_file_path):
             messagebox.showerror(
-                "Error", "Unsupported file type selected for payload.")
+                "Error", "The payload must be a file.")
             self.payload_file_path = None
             self.payload_entry.delete(0, tk.END)
             return
@@ -172,10 +203,10 @@ class SteganographyApp:
         self.cover_file_path = filedialog.askopenfilename(
             title="Select Cover Object (Image/Audio/Video)",
             filetypes=[("All Supported Files",
-                        "*.txt;*.png;*.bmp;*.wav;*.mp4;*.avi")]
+                        ";".join("*" + extension for extension in ACCEPTABLE_COVER_EXTENSIONS))]
         )
         if self.cover_file_path:
-            if not self.cover_file_path.lower().endswith(tuple(ACCEPTABLE_COVER_EXTENSIONS)):
+            if not is_supported(self.cover_file_path):
                 messagebox.showerror(
                     "Error", "Unsupported file type selected for cover object.")
                 self.cover_file_path = None
@@ -194,53 +225,33 @@ class SteganographyApp:
             # Initialize fps variable
             self.video_fps = None
 
-            if self.cover_file_path.endswith('.png') or self.cover_file_path.endswith('.bmp'):
-                img = Image.open(self.cover_file_path)
-                cover_bits = img.size[0] * img.size[1] * 3 * self.lsb_var.get()
-            elif self.cover_file_path.endswith('.wav'):
-                with open(self.cover_file_path, 'rb') as f:
-                    cover_bits = len(f.read()) * 8
-            elif self.cover_file_path.endswith('.txt'):
-                with open(self.cover_file_path, 'r') as f:
-                    cover_bits = len(f.read()) * 8
-            elif self.cover_file_path.endswith('.mp4') or self.cover_file_path.endswith('.avi'):
-                cap = cv2.VideoCapture(self.cover_file_path)
-                ret, frame = cap.read()
-                if ret:
-                    height, width, channels = frame.shape
-                    cover_bits = height * width * channels * self.lsb_var.get()
-
-                    # Get FPS
-                    self.video_fps = cap.get(cv2.CAP_PROP_FPS)
-                    print(f"The FPS of the video is: {self.video_fps}")
-
-                    # Get total frame count
-                    frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
-                    self.video_frame_count = frame_count
-
-                    # Calculate duration
-                    self.video_duration = frame_count / self.video_fps if self.video_fps else 0
-
-                    # Display FPS and Duration in the GUI
-                    self.fps_label = tk.Label(
-                        self.frame, text=f"Video FPS: {self.video_fps:.2f}",
-                        bg="#ffffff", font=("Arial", 12))
-                    self.fps_label.grid(row=4, column=0, columnspan=2, pady=5)
-
-                    self.duration_label = tk.Label(
-                        self.frame, text=f"Video Duration: {self.video_duration:.2f} seconds",
-                        bg="#ffffff", font=("Arial", 12))
-                    self.duration_label.grid(row=5, column=0, columnspan=2, pady=5)
-                else:
-                    cover_bits = 0
-                cap.release()
+            cover_bits = probe_capacity(self.cover_file_path, self.lsb_var.get())
+            if cover_kind(self.cover_file_path) == 'video':
+                # Container metadata only; no frame is decoded
+                width, height, self.video_fps, frame_count = CODECS['video'].properties(self.cover_file_path)
+                print(f"The FPS of the video is: {self.video_fps}")
+                self.video_frame_count = frame_count
+
+                # Calculate duration
+                self.video_duration = frame_count / self.video_fps if self.video_fps else 0
+
+                # Display FPS and Duration in the GUI
+                self.fps_label = tk.Label(
+                    self.frame, text=f"Video FPS: {self.video_fps:.2f}",
+                    bg="#ffffff", font=("Arial", 12))
+                self.fps_label.grid(row=4, column=0, columnspan=2, pady=5)
+
+                self.duration_label = tk.Label(
+                    self.frame, text=f"Video Duration: {self.video_duration:.2f} seconds",
+                    bg="#ffffff", font=("Arial", 12))
+                self.duration_label.grid(row=5, column=0, columnspan=2, pady=5)
             print(f"Cover bits: '{cover_bits}'")
 
     def display_cover(self):
-        if self.cover_file_path.endswith(('.png', '.bmp')):
+        kind = cover_kind(self.cover_file_path)
+        if kind == 'image':
             # Show the image label, hide the video player
-            self.video_player.stop()
-            self.video_player.pack_forget()
+            self.hide_video_player()
             self.cover_display.pack(padx=10, pady=10)
             img = Image.open(self.cover_file_path)
             img.thumbnail((300, 300))
@@ -248,56 +259,52 @@ class SteganographyApp:
             self.cover_display.config(image=img_tk)
             self.cover_display.image = img_tk
             self.original_frame.pack()
-        elif self.cover_file_path.endswith('.wav'):
-            # Hide both image and video display
-            self.cover_display.pack_forget()
-            self.video_player.pack_forget()
-            messagebox.showinfo(
-                "Cover Object", "Audio file selected as cover object.")
-            self.original_frame.pack_forget()
-        elif self.cover_file_path.endswith('.mp4') or self.cover_file_path.endswith('.avi'):
+        elif kind == 'video':
             # Hide the image display, show the video player
             self.cover_display.pack_forget()
             self.original_frame.pack()
+            if self.video_player is None:
+                self.video_player = new_video_player(self.original_frame)
             # Load and play the video
             self.video_player.load(self.cover_file_path)
             # Set up looping
             self.video_player.bind("<<Ended>>", lambda e: self.video_player.play())
             self.video_player.play()
             self.video_player.pack(expand=True, fill="both")
-        elif self.cover_file_path.endswith('.txt'):
+        elif kind in ('audio', 'text'):
             # Hide both image and video display
             self.cover_display.pack_forget()
-            self.video_player.pack_forget()
+            self.hide_video_player()
             messagebox.showinfo(
-                "Cover Object", "Text file selected as cover object.")
+                "Cover Object", f"{kind.capitalize()} file selected as cover object.")
             self.original_frame.pack_forget()
         else:
             # Hide both image and video display
             self.cover_display.pack_forget()
-            self.video_player.pack_forget()
+            self.hide_video_player()
             messagebox.showerror("Error", "Unsupported file type selected.")
 
+    def hide_video_player(self):
+        if self.video_player is not None:
+            self.video_player.stop()
+            self.video_player.pack_forget()
+
     def load_payload_file(self):
         global payload_bits
         self.payload_file_path = filedialog.askopenfilename(
-            title="Select Payload (Text File)",
-            filetypes=[("Text files", "*.txt")]
+            title="Select Payload (Any File)",
+            filetypes=[("All files", "*.*")]
         )
         if self.payload_file_path:
-            if not self.payload_file_path.lower().endswith(tuple(ACCEPTABLE_PAYLOAD_EXTENSIONS)):
-                messagebox.showerror(
-                    "Error", "Unsupported file type selected for payload.")
-                self.payload_file_path = None
-                self.payload_entry.delete(0, tk.END)
-                return
             self.payload_entry.delete(0, tk.END)
             self.payload_entry.insert(0, self.payload_file_path)
-            with open(self.payload_file_path, 'r') as f:
-                payload_bits = len(f.read()) * 8  # Each character in text is 1 byte, or 8 bits
+            payload_bits = os.path.getsize(self.payload_file_path) * 8  # Payloads are embedded byte for byte
             print(f"Payload bits: '{payload_bits}'")
 
     def check_capacity(self):
+        global cover_bits
+        # Re-probe so a change to the number of LSBs after selecting the cover is taken into account
+        cover_bits = probe_capacity(self.cover_file_path, self.lsb_var.get())
         if payload_bits > cover_bits:
             messagebox.showerror(
                 "Error", "Payload file is too large for the selected cover object.")
@@ -309,73 +316,31 @@ class SteganographyApp:
             lsb_bits = self.lsb_var.get()
             # Default frame number set to 0 (first frame)
             frame_number = 0
+            cover_file_path = self.cover_file_path
+            payload_file_path = self.payload_file_path
 
             if not self.check_capacity():
                 return
 
-            if self.cover_file_path.endswith('.png') or self.cover_file_path.endswith('.bmp'):
-                output_path = filedialog.asksaveasfilename(
-                    defaultextension=".png", filetypes=[("PNG files", "*.png")])
-                if output_path:
-                    encode_image(
-                        self.cover_file_path, self.payload_file_path, output_path, lsb_bits)
-                    messagebox.showinfo(
-                        "Success", f"Encoded stego image saved as {output_path}")
-                    self.display_stego_image(output_path)
-                    self.comparison_frame.pack()
-
-            elif self.cover_file_path.endswith('.wav'):
-                output_path = filedialog.asksaveasfilename(
-                    defaultextension=".wav", filetypes=[("WAV files", "*.wav")])
-                if output_path:
-                    encode_audio_lsb(
-                        self.cover_file_path, self.payload_file_path, output_path)
+            codec = codec_for(cover_file_path)
+            output_path = filedialog.asksaveasfilename(
+                defaultextension=codec.output_extension,
+                filetypes=[(codec.file_type, "*" + codec.output_extension)])
+            if output_path:
+                def on_success(stego_path):
+                    # The codec may change the name it writes to (video is always saved as .avi)
+                    self.stego_file_path = stego_path
                     messagebox.showinfo(
-                        "Success", f"Encoded stego audio saved as {output_path}")
-
-            elif self.cover_file_path.endswith('.mp4') or self.cover_file_path.endswith('.avi'):
-                output_path = filedialog.asksaveasfilename(
-                    defaultextension=".avi", filetypes=[("AVI files", "*.avi")])
-                if output_path:
-                    encode_video(
-                        self.cover_file_path, self.payload_file_path, frame_number, lsb_bits, output_path)
-                    messagebox.showinfo(
-                        "Success", f"Encoded stego video saved as {output_path}")
-                    self.display_stego_image(output_path)
-                    self.comparison_frame.pack()
-
-            elif self.cover_file_path.endswith('.txt'):
-                with open(self.cover_file_path, 'r') as cover_file:
-                    cover_data = cover_file.read()
-                with open(self.payload_file_path, 'r') as payload_file:
-                    payload_data = payload_file.read()
-                payload_bits_str = ''.join(format(ord(char), '07b')
-                                           for char in payload_data)
-                encoded_text = ''
-                payload_index = 0
-                for char in cover_data:
-                    encoded_text += char
-                    if payload_index < len(payload_bits_str):
-                        if payload_bits_str[payload_index] == '1':
-                            encoded_text += '\t'
-                        else:
-                            encoded_text += ' '
-                        payload_index += 1
-                while payload_index < len(payload_bits_str):
-                    if payload_bits_str[payload_index] == '1':
-                        encoded_text += '\t'
-                    else:
-                        encoded_text += ' '
-                    payload_index += 1
-                output_path = filedialog.asksaveasfilename(
-                    defaultextension=".txt", filetypes=[("Text files", "*.txt")])
-                if output_path:
-                    with open(output_path, 'w') as encoded_file:
-                        encoded_file.write(encoded_text)
-                    messagebox.showinfo(
-                        "Success", f"Encoded text file saved as {output_path}")
-                print(
-                    f"Encoded text (truncated): {encoded_text[:100]}...")
+                        "Success", f"Encoded stego {codec.name} saved as {stego_path}")
+                    if codec.name in ('image', 'video'):
+                        self.display_stego_image(stego_path)
+                        self.comparison_frame.pack()
+                self.run_in_background(
+                    f"Encoding {codec.name}...",
+                    lambda progress: codec.encode(
+                        cover_file_path, payload_file_path, output_path, lsb_bits, progress,
+                        frame_number=frame_number),
+                    on_success)
         else:
             messagebox.showerror(
                 "Error", "Please select both a cover object and a payload.")
@@ -385,49 +350,118 @@ class SteganographyApp:
             lsb_bits = self.lsb_var.get()
             # Default frame number set to 0 (first frame)
             frame_number = 0
+            cover_file_path = self.cover_file_path
 
-            if self.cover_file_path.endswith('.png') or self.cover_file_path.endswith('.bmp'):
-                decoded_message = decode_image(
-                    self.cover_file_path, lsb_bits)
-                messagebox.showinfo("Decoded Message", decoded_message)
-
-            elif self.cover_file_path.endswith('.wav'):
-                decoded_message = decode_audio_lsb(self.cover_file_path)
-                messagebox.showinfo("Decoded Message", decoded_message)
-
-            elif self.cover_file_path.endswith('.avi') or self.cover_file_path.endswith('.mp4'):
-                decoded_message = decode_video(
-                    self.cover_file_path, frame_number, lsb_bits)
-                messagebox.showinfo("Decoded Message", decoded_message)
-
-            elif self.cover_file_path.endswith('.txt'):
-                with open(self.cover_file_path, 'r') as encoded_file:
-                    encoded_data = encoded_file.read()
-                extracted_bits = ''
-                for char in encoded_data:
-                    if char == '\t':
-                        extracted_bits += '1'
-                    elif char == ' ':
-                        extracted_bits += '0'
-                decoded_message = ''
-                for i in range(0, len(extracted_bits), 7):
-                    byte = extracted_bits[i:i + 7]
-                    if len(byte) == 7:
-                        decoded_message += chr(int(byte, 2))
-                if decoded_message:
-                    messagebox.showinfo("Decoded Message", decoded_message)
-                else:
-                    messagebox.showwarning(
-                        "Warning", "No hidden message found in the selected file.")
+            codec = codec_for(cover_file_path)
+            self.run_in_background(
+                f"Decoding {codec.name}...",
+                lambda progress: codec.decode(cover_file_path, lsb_bits, progress, frame_number=frame_number),
+                self.show_decoded_payload)
         else:
             messagebox.showerror("Error", "Please select a cover object.")
 
+    def run_in_background(self, description, job, on_success):
+        # Run job(progress) on a worker thread so the window and the video previews keep
+        # running. The worker only talks to Tk through self.worker_events, which the main
+        # loop drains in poll_worker; progress() raises OperationCancelled after Cancel.
+        if self.worker is not None and self.worker.is_alive():
+            messagebox.showerror("Error", "Another operation is still running.")
+            return
+
+        cancel_event = threading.Event()
+        events = queue.Queue()
+
+        def progress(done, total):
+            if cancel_event.is_set():
+                raise OperationCancelled()
+            events.put(('progress', done, total))
+
+        def target():
+            try:
+                result = job(progress)
+            except OperationCancelled:
+                events.put(('cancelled',))
+            except Exception as e:
+                events.put(('error', e))
+            else:
+                events.put(('done', result))
+
+        self.cancel_event = cancel_event
+        self.worker_events = events
+        self.set_busy(True, description)
+        self.worker = threading.Thread(target=target, daemon=True)
+        self.worker.start()
+        self.root.after(WORKER_POLL_MS, self.poll_worker, on_success)
+
+    def poll_worker(self, on_success):
+        while True:
+            try:
+                event = self.worker_events.get_nowait()
+            except queue.Empty:
+                self.root.after(WORKER_POLL_MS, self.poll_worker, on_success)
+                return
+            if event[0] == 'progress':
+                _, done, total = event
+                if total:
+                    self.progress_bar.stop()
+                    self.progress_bar.config(mode="determinate", maximum=total, value=min(done, total))
+                continue
+
+            self.set_busy(False)
+            if event[0] == 'done':
+                on_success(event[1])
+            elif event[0] == 'error':
+                messagebox.showerror("Error", str(event[1]))
+            else:
+                messagebox.showinfo("Cancelled", "The operation was cancelled.")
+            return
+
+    def cancel_operation(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            self.status_label.config(text="Cancelling...")
+
+    def set_busy(self, busy, description=""):
+        state = tk.DISABLED if busy else tk.NORMAL
+        self.encode_button.config(state=state)
+        self.decode_button.config(state=state)
+        if busy:
+            self.status_label.config(text=description)
+            self.progress_bar.config(mode="indeterminate", value=0)
+            self.progress_bar.start()
+            self.progress_frame.grid()
+        else:
+            self.progress_bar.stop()
+            self.progress_frame.grid_remove()
+            self.cancel_event = None
+
+    def show_decoded_payload(self, decoded_payload):
+        # Show text payloads directly, offer to save anything else as a file
+        if not decoded_payload:
+            messagebox.showwarning(
+                "Warning", "No hidden message found in the selected file.")
+            return
+        try:
+            messagebox.showinfo("Decoded Message", decoded_payload.decode('utf-8'))
+            return
+        except UnicodeDecodeError:
+            pass
+        output_path = filedialog.asksaveasfilename(
+            title="The decoded payload is not text. Save it as:",
+            filetypes=[("All files", "*.*")])
+        if output_path:
+            with open(output_path, 'wb') as payload_file:
+                payload_file.write(decoded_payload)
+            messagebox.showinfo(
+                "Success", f"Decoded payload saved as {output_path}")
+
     def display_stego_image(self, path):
         # Clear existing widgets in comparison_frame
         for widget in self.comparison_frame.winfo_children():
             widget.destroy()
 
-        if path.endswith(('.png', '.bmp')):
+        kind = cover_kind(path)
+        if kind == 'image':
             self.stego_image_label = tk.Label(
                 self.comparison_frame, text="Encoded Stego Image:",
                 bg="#e0e0e0", font=("Arial", 12))
@@ -441,13 +475,13 @@ class SteganographyApp:
             self.stego_display.image = img_tk
             self.stego_display.pack(padx=10, pady=10)
             self.comparison_frame.pack()
-        elif path.endswith('.mp4') or path.endswith('.avi'):
+        elif kind == 'video':
             self.stego_image_label = tk.Label(
                 self.comparison_frame, text="Encoded Stego Video:",
                 bg="#e0e0e0", font=("Arial", 12))
             self.stego_image_label.pack(pady=5)
 
-            self.stego_video_player = TkinterVideo(self.comparison_frame, scaled=True)
+            self.stego_video_player = new_video_player(self.comparison_frame)
             self.stego_video_player.load(path)
             # Set up looping
             self.stego_video_player.bind("<<Ended>>", lambda e: self.stego_video_player.play())
@@ -462,6 +496,14 @@ class SteganographyApp:
                 "Stego Object", "Stego object saved successfully.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LSB steganography GUI.")
+    parser.add_argument('--cache-dir',
+                        help="Keep decoded payloads here (in the clear) so decoding a file again is instant")
+    parser.add_argument('--cache-mb', type=int, default=DEFAULT_CACHE_BYTES >> 20, help="Size cap of --cache-dir")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(name)s: %(message)s')
+    if args.cache_dir:
+        enable_decode_cache(args.cache_dir, args.cache_mb << 20)
     root = TkinterDnD.Tk()
     app = SteganographyApp(root)
     root.mainloop()
\ No newline at end of file
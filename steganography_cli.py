@@ -0,0 +1,202 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from codec_registry import codec_for, extension_of, is_supported, COMPRESSION_IDS
+from instrumentation import add_timing_hook, remove_timing_hook, latency_histogram
+from decode_cache import enable_decode_cache, DEFAULT_CACHE_BYTES
+
+# Job fields passed on to the codec (the ones that do not apply to it are ignored)
+JOB_OPTIONS = ('lsb_count', 'key', 'compression', 'compress_level', 'mapped', 'mode', 'frame_number', 'channels',
+               'start_frame', 'end_frame', 'audio_channels')
+
+def job_options(job):
+    # Jobs already run in parallel, so spread-mode video uses one process per job
+    options = {name: job[name] for name in JOB_OPTIONS if name in job}
+    options['workers'] = 1
+    return options
+
+def encode_job(job):
+    codec = codec_for(job['cover'])
+    return codec.encode(job['cover'], job['payload'], os.path.abspath(job['output']), **job_options(job))
+
+def decode_job(job):
+    payload = codec_for(job['cover']).decode(job['cover'], **job_options(job))
+    with open(job['output'], 'wb') as file:
+        file.write(payload)
+    return job['output']
+
+def run_job(operation, job):
+    # Runs on the worker pool; failures are reported in the summary instead of stopping the batch
+    result = {'operation': operation, 'cover': job['cover'], 'output': job.get('output'), 'phases': {}}
+
+    def collect(event):
+        # Seconds per phase of this job, from the codecs' timing events
+        phases = result['phases']
+        phases[event['phase']] = round(phases.get(event['phase'], 0) + event['seconds'], 6)
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    add_timing_hook(collect)
+    try:
+        result['codec'] = codec_for(job['cover']).name
+        result['output'] = encode_job(job) if operation == 'encode' else decode_job(job)
+        result['output_bytes'] = os.path.getsize(result['output'])
+        result['status'] = 'ok'
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        remove_timing_hook(collect)
+    result['seconds'] = round(time.perf_counter() - start, 6)
+    # CPU time of the worker process itself (ffmpeg subprocesses are not included)
+    result['cpu_seconds'] = round(time.process_time() - cpu_start, 6)
+    return result
+
+def load_manifest(manifest_path):
+    # One JSON object per line: {"cover": ..., "payload": ..., "output": ..., "lsb_count": ...}
+    jobs = []
+    with open(manifest_path, 'r') as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                jobs.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{manifest_path}:{line_number}: {e}")
+    return jobs
+
+def channel_list(value):
+    try:
+        return [int(channel) for channel in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected channel numbers separated by commas, not {value!r}")
+
+def build_jobs(args):
+    jobs = load_manifest(args.manifest) if args.manifest else [
+        {'cover': cover} for cover in sorted(glob.glob(args.covers, recursive=True))]
+
+    for job in jobs:
+        if 'cover' not in job:
+            raise ValueError(f"Job without a cover: {job}")
+        for key in ('lsb_count', 'frame_number', 'mode', 'channels', 'mapped', 'compress_level', 'key', 'compression',
+                    'audio_channels'):
+            if getattr(args, key) is not None:
+                job.setdefault(key, getattr(args, key))
+        if args.operation == 'encode':
+            job.setdefault('payload', args.payload)
+            if not job['payload']:
+                raise ValueError(f"Job without a payload: {job['cover']}")
+        if 'output' not in job:
+            if not args.output_dir:
+                raise ValueError(f"Job without an output and no --output-dir: {job['cover']}")
+            job['output'] = os.path.join(args.output_dir, output_name(args.operation, job))
+
+    # Two jobs writing the same file would both report ok, with one output lost
+    outputs = {}
+    for job in jobs:
+        output = os.path.abspath(job['output'])
+        if output in outputs:
+            raise ValueError(f"{outputs[output]} and {job['cover']} would both be written to {job['output']}")
+        outputs[output] = job['cover']
+    return jobs
+
+def output_name(operation, job):
+    # The cover's file name with the output extension added (c.bmp -> c.bmp.png,
+    # c.wav -> c.wav.payload), so covers that differ only in extension never collide.
+    # A cover that already has the output extension keeps its name (c.png -> c.png).
+    name = os.path.basename(job['cover'])
+    extension = '.payload'
+    if operation == 'encode' and is_supported(job['cover']):
+        extension = codec_for(job['cover']).output_extension
+    if operation == 'encode' and job.get('mapped') and extension_of(job['cover']) == '.bmp':
+        extension = '.bmp'  # The mapped encoder patches a copy of the BMP itself
+    return name if operation == 'encode' and extension_of(name) == extension else name + extension
+
+def run_batch(operation, jobs, workers, cache=None):
+    # cache is (directory, max_bytes) to turn on the decode cache in every worker
+    start = time.perf_counter()
+    if workers > 1:
+        initializer = enable_decode_cache if cache else None
+        with ProcessPoolExecutor(workers, initializer=initializer, initargs=cache or ()) as executor:
+            results = list(executor.map(run_job, [operation] * len(jobs), jobs))
+    else:
+        if cache:
+            enable_decode_cache(*cache)
+        results = [run_job(operation, job) for job in jobs]
+
+    # Latency histogram of every phase, per codec, over the successful jobs
+    durations = defaultdict(list)
+    for result in results:
+        if result['status'] == 'ok':
+            for phase, seconds in result['phases'].items():
+                durations[f"{result['codec']}.{phase}"].append(seconds)
+    return {
+        'operation': operation,
+        'workers': workers,
+        'jobs': len(results),
+        'failed': sum(result['status'] != 'ok' for result in results),
+        'wall_seconds': round(time.perf_counter() - start, 6),
+        'job_seconds': round(sum(result['seconds'] for result in results), 6),
+        'cpu_seconds': round(sum(result['cpu_seconds'] for result in results), 6),
+        'phases': {name: latency_histogram(values) for name, values in sorted(durations.items())},
+        'results': results,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Encode or decode many carriers in parallel. The codec is picked from the cover extension.")
+    parser.add_argument('operation', choices=['encode', 'decode'])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--manifest', help="JSON lines file with one job per line")
+    source.add_argument('--covers', help="Glob of cover (encode) or stego (decode) files")
+    parser.add_argument('--payload', help="Payload file for every --covers job (encode)")
+    parser.add_argument('--output-dir', help="Where to write outputs for jobs without an 'output'")
+    parser.add_argument('--lsb-count', dest='lsb_count', type=int, help="Default LSB count (1-8)")
+    parser.add_argument('--frame-number', dest='frame_number', type=int, help="Default video frame")
+    parser.add_argument('--mode', choices=['frame', 'spread'], help="Default video mode")
+    parser.add_argument('--channels', type=int, help="Default channel count for spread video mode")
+    parser.add_argument('--audio-channels', dest='audio_channels', type=channel_list, metavar='0,1,...',
+                        help="Embed only in these WAV channels (default: all of them)")
+    parser.add_argument('--mapped', action='store_true', default=None,
+                        help="Encode BMP and WAV covers by copying the file and patching only the payload bytes")
+    parser.add_argument('--compress-level', dest='compress_level', type=int, choices=range(10),
+                        metavar='0-9', help="PNG compression level for image outputs (0-1 is fastest)")
+    parser.add_argument('--compression', choices=sorted(COMPRESSION_IDS),
+                        help="Compress payloads before embedding (decoders detect it automatically)")
+    parser.add_argument('--key', help="Scatter the payload along a permutation derived from this key")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Size of the process pool")
+    parser.add_argument('--cache-dir', help="Keep decode results here and reuse them for unchanged carriers")
+    parser.add_argument('--cache-mb', type=int, default=DEFAULT_CACHE_BYTES >> 20,
+                        help="Size cap of --cache-dir; least recently used results are dropped")
+    parser.add_argument('--summary', help="Write the JSON summary here instead of stdout")
+    parser.add_argument('--log-level', default='WARNING', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="Codec log messages (DEBUG includes every timing event) go to stderr")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level, stream=sys.stderr, format='%(levelname)s %(name)s: %(message)s')
+
+    try:
+        jobs = build_jobs(args)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    cache = (args.cache_dir, args.cache_mb << 20) if args.cache_dir else None
+    summary = run_batch(args.operation, jobs, max(1, args.workers), cache)
+    if args.summary:
+        with open(args.summary, 'w') as file:
+            json.dump(summary, file, indent=2)
+    else:
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+    return 1 if summary['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,430 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import parse_qsl, urlsplit
+from codec_registry import CODECS, EXTENSIONS, extension_of
+from progress import OperationCancelled
+from decode_cache import enable_decode_cache, DEFAULT_CACHE_BYTES
+
+# A long-running local HTTP server in front of the codecs, so callers do not pay for a new
+# interpreter and the PIL/OpenCV imports on every request. Jobs run on a pool of worker
+# processes started (and warmed up) once; the event loop only parses requests and streams
+# responses.
+#
+#   POST /encode    multipart/form-data with 'cover' and 'payload' files -> the stego file
+#   POST /decode    multipart/form-data with a 'stego' file -> the payload
+#   POST /capacity  multipart/form-data with a 'cover' file -> {"bits": ..., "bytes": ...}
+#   GET  /status    pool and queue counters as JSON
+#
+# Options (lsb_count, key, compression, compress_level, frame_number, mode, channels,
+# start_frame, end_frame, audio_channels as e.g. '0,1') come from the query string or from
+# plain form fields. The codec is picked from the uploaded file name's extension, or from a
+# 'codec' option.
+#
+# Backpressure: at most workers jobs run at once and at most max_pending are waiting; a
+# request beyond that gets 503 straight away with Retry-After. Bodies over max_body bytes
+# get 413. A job that runs longer than the timeout gets 504; the worker stops it at the
+# codec's next progress report (OperationCancelled), so its slot comes back shortly after.
+# Codecs report once per block of rows, samples, characters or frames, so a job overshoots
+# by at most one such step, plus any single step that cannot report part way (writing a
+# PNG, or one large video frame). If the job then finishes anyway, its result is thrown
+# away, including the temporary directory of a video output.
+#
+# Images, audio and text are handled in memory. Video covers are written to a temporary
+# directory for the job, since OpenCV and ffmpeg only open files.
+
+DEFAULT_PORT = 8765
+DEFAULT_TIMEOUT = 120
+DEFAULT_MAX_BODY = 512 << 20
+
+# Bytes written to the client per step while streaming a response
+RESPONSE_CHUNK = 1 << 20
+
+# Extra time the server waits after the timeout for the worker to cancel the job itself
+TIMEOUT_GRACE = 5
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 411: 'Length Required',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable',
+           504: 'Gateway Timeout'}
+
+INTEGER_OPTIONS = ('lsb_count', 'compress_level', 'frame_number', 'channels', 'start_frame', 'end_frame')
+
+logger = logging.getLogger(__name__)
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+################################### WORKER SIDE ##########################################
+
+def warm_worker():
+    # Runs once per worker process: import every codec module (and PIL, OpenCV, NumPy)
+    # now, so the first request does not wait for them
+    for codec in CODECS.values():
+        codec.module
+    return os.getpid()
+
+def deadline_progress(deadline):
+    # Progress callback that stops the job once the wall-clock deadline has passed
+    def progress(done, total):
+        if time.time() > deadline:
+            raise OperationCancelled("The job ran past its timeout.")
+    return progress
+
+def run_request(operation, codec_name, files, options, deadline):
+    # Runs on the worker pool. Returns ('data', bytes), ('file', path, directory to remove
+    # afterwards) for outputs of codecs that need files, or ('json', dict) for capacity.
+    codec = CODECS[codec_name]
+    options = dict(options, progress=deadline_progress(deadline), workers=1)
+    options.pop('codec', None)
+    if not codec.in_memory:
+        return run_file_request(codec, operation, files, options)
+
+    carrier = files['stego' if operation == 'decode' else 'cover'][1]
+    if operation == 'capacity':
+        bits = codec.capacity(carrier, **options)
+        return 'json', {'bits': bits, 'bytes': bits // 8}
+    if operation == 'decode':
+        return 'data', codec.decode(carrier, **options)
+    return 'data', codec.encode_buffer(carrier, files['payload'][1], **options)
+
+def run_file_request(codec, operation, files, options):
+    directory = tempfile.mkdtemp(prefix='stego-job-')
+    try:
+        name, data = files['stego' if operation == 'decode' else 'cover']
+        input_path = os.path.join(directory, 'input' + extension_of(name))
+        with open(input_path, 'wb') as file:
+            file.write(data)
+
+        if operation == 'capacity':
+            bits = codec.capacity(input_path, **options)
+            return 'json', {'bits': bits, 'bytes': bits // 8}
+        if operation == 'decode':
+            return 'data', codec.decode(input_path, **options)
+
+        output = os.path.join(directory, 'output' + codec.output_extension)
+        output = codec.encode(input_path, files['payload'][1], output, **options)
+        os.remove(input_path)
+        return 'file', output, directory
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    finally:
+        if operation != 'encode':
+            shutil.rmtree(directory, ignore_errors=True)
+
+################################### SERVER SIDE ##########################################
+
+def discard_result(future):
+    # Remove the temporary directory of a finished job's ('file', path, directory) result
+    if not future.cancelled() and future.exception() is None:
+        result = future.result()
+        if result[0] == 'file':
+            shutil.rmtree(result[2], ignore_errors=True)
+
+def parse_multipart(body, content_type):
+    # {name: (filename, bytes)} for file parts and {name: value} for plain fields
+    parameters = dict(parse_header_parameters(content_type))
+    boundary = parameters.get('boundary')
+    if not content_type.lower().startswith('multipart/form-data') or not boundary:
+        raise HTTPError(400, "Expected a multipart/form-data body.")
+    files, fields = {}, {}
+    delimiter = b'--' + boundary.encode('latin-1')
+    for part in body.split(delimiter)[1:]:
+        if part.startswith(b'--'):
+            break
+        head, separator, data = part.partition(b'\r\n\r\n')
+        if not separator:
+            raise HTTPError(400, "Malformed multipart body.")
+        if data.endswith(b'\r\n'):
+            data = data[:-2]
+        disposition = ''
+        for line in head.decode('latin-1').split('\r\n'):
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'content-disposition':
+                disposition = value
+        parameters = dict(parse_header_parameters(disposition))
+        if 'name' not in parameters:
+            continue
+        if 'filename' in parameters:
+            files[parameters['name']] = (parameters['filename'], data)
+        else:
+            fields[parameters['name']] = data.decode('utf-8')
+    return files, fields
+
+def parse_header_parameters(value):
+    # ('boundary', '...') style pairs from a header value such as a Content-Type
+    for item in value.split(';')[1:]:
+        name, _, parameter = item.strip().partition('=')
+        yield name.strip().lower(), parameter.strip().strip('"')
+
+def parse_options(fields):
+    options = {}
+    for name, value in fields.items():
+        if name in INTEGER_OPTIONS:
+            try:
+                options[name] = int(value)
+            except ValueError:
+                raise HTTPError(400, f"{name} must be an integer.")
+        elif name == 'audio_channels':
+            try:
+                options[name] = [int(channel) for channel in value.split(',')]
+            except ValueError:
+                raise HTTPError(400, "audio_channels must be channel numbers separated by commas.")
+        elif name in ('key', 'compression', 'mode', 'codec'):
+            options[name] = value
+    return options
+
+def request_codec(operation, files, options):
+    required = ('cover', 'payload') if operation == 'encode' else ('stego',) if operation == 'decode' else ('cover',)
+    for name in required:
+        if name not in files:
+            raise HTTPError(400, f"Missing the '{name}' file.")
+    if 'codec' in options:
+        if options['codec'] not in CODECS:
+            raise HTTPError(400, f"Unknown codec: {options['codec']}")
+        return options['codec']
+    filename = files[required[0]][0]
+    extension = extension_of(filename)
+    if extension not in EXTENSIONS:
+        raise HTTPError(400, f"Unsupported file type: {extension or filename}")
+    return EXTENSIONS[extension].name
+
+class JobServer:
+    def __init__(self, workers=None, max_pending=None, timeout=DEFAULT_TIMEOUT, max_body=DEFAULT_MAX_BODY,
+                 cache=None):
+        self.workers = workers or os.cpu_count()
+        self.max_pending = max_pending if max_pending is not None else 4 * self.workers
+        self.timeout = timeout
+        self.max_body = max_body
+        self.cache = cache  # (directory, max_bytes) for the decode cache, or None
+        self.slots = None
+        self.waiting = 0
+        self.running = 0
+        self.counters = {'completed': 0, 'failed': 0, 'rejected': 0, 'timed_out': 0}
+        self.executor = None
+        self.abandoned = set()  # Running jobs nobody waits for any more
+
+    def start_pool(self):
+        # Spawned rather than forked: the parent runs an event loop and threads
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=enable_decode_cache if self.cache else None,
+                                            initargs=self.cache or ())
+        for future in [self.executor.submit(warm_worker) for _ in range(self.workers)]:
+            future.result()
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(cancel_futures=True)
+
+    async def submit(self, operation, codec, files, options):
+        # Wait for a free worker (or refuse if too many jobs are already waiting), then run
+        # the job with its deadline
+        if self.waiting >= self.max_pending and self.slots.locked():
+            self.counters['rejected'] += 1
+            raise HTTPError(503, "The server is busy; try again later.", {'Retry-After': '1'})
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        loop = asyncio.get_running_loop()
+        self.running += 1
+        try:
+            future = loop.run_in_executor(self.executor, run_request, operation, codec, files, options,
+                                          time.time() + self.timeout)
+        except BaseException:
+            self.running -= 1
+            self.slots.release()
+            raise
+        # The slot is only given back once the worker is really free, even if the client
+        # has gone away or the server stopped waiting for it
+        future.add_done_callback(self.job_finished)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout + TIMEOUT_GRACE)
+        except asyncio.TimeoutError:
+            self.abandon(future)
+            self.counters['timed_out'] += 1
+            raise HTTPError(504, f"The job did not finish within {self.timeout} seconds.")
+        except asyncio.CancelledError:
+            self.abandon(future)
+            raise
+        except OperationCancelled:
+            self.counters['timed_out'] += 1
+            raise HTTPError(504, f"The job did not finish within {self.timeout} seconds.")
+        except BrokenProcessPool:
+            logger.error("A worker process died; restarting the pool")
+            self.close()
+            await loop.run_in_executor(None, self.start_pool)
+            raise HTTPError(500, "A worker process died while running the job.")
+
+    def job_finished(self, future):
+        self.running -= 1
+        self.slots.release()
+        if future.cancelled() or future.exception() is not None:
+            self.counters['failed'] += 1
+        else:
+            self.counters['completed'] += 1
+        if future in self.abandoned:
+            self.abandoned.discard(future)
+            discard_result(future)
+
+    def abandon(self, future):
+        # Nobody will send this job's result; remove its files as soon as it has one
+        if future.done():
+            discard_result(future)
+        else:
+            self.abandoned.add(future)
+
+    def status(self):
+        return {'workers': self.workers, 'running': self.running, 'waiting': self.waiting,
+                'max_pending': self.max_pending, 'timeout': self.timeout, **self.counters}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            status, headers, body = await self.handle_request(reader)
+        except HTTPError as e:
+            status, headers, body = e.status, e.headers, ('json', {'error': str(e)})
+        except (ValueError, OSError) as e:
+            status, headers, body = 400, {}, ('json', {'error': f"{type(e).__name__}: {e}"})
+        except asyncio.IncompleteReadError:
+            writer.close()
+            return
+        except Exception as e:
+            logger.exception("Request failed")
+            status, headers, body = 500, {}, ('json', {'error': f"{type(e).__name__}: {e}"})
+        try:
+            await send_response(writer, status, headers, body)
+        except ConnectionError:
+            pass
+        finally:
+            if body[0] == 'file':
+                shutil.rmtree(body[2], ignore_errors=True)
+            writer.close()
+
+    async def handle_request(self, reader):
+        request_line = (await reader.readuntil(b'\r\n')).decode('latin-1').rstrip('\r\n')
+        method, _, rest = request_line.partition(' ')
+        target = rest.rpartition(' ')[0] or rest
+        headers = {}
+        while True:
+            line = (await reader.readuntil(b'\r\n')).decode('latin-1').rstrip('\r\n')
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        url = urlsplit(target)
+        operation = url.path.strip('/')
+        if operation == 'status':
+            return 200, {}, ('json', self.status())
+        if operation not in ('encode', 'decode', 'capacity'):
+            raise HTTPError(404, f"Unknown endpoint: {url.path}")
+        if method != 'POST':
+            raise HTTPError(405, f"{url.path} only takes POST requests.")
+        if 'content-length' not in headers:
+            raise HTTPError(411, "The request needs a Content-Length.")
+        length = int(headers['content-length'])
+        if length > self.max_body:
+            raise HTTPError(413, f"The request body is larger than {self.max_body} bytes.")
+
+        files, fields = parse_multipart(await reader.readexactly(length), headers.get('content-type', ''))
+        options = parse_options({**dict(parse_qsl(url.query)), **fields})
+        codec = request_codec(operation, files, options)
+        started = time.perf_counter()
+        result = await self.submit(operation, codec, files, options)
+        logger.info("%s %s done in %.3fs", operation, codec, time.perf_counter() - started)
+
+        headers = {}
+        if result[0] != 'json':
+            content_type = CODECS[codec].media_type if operation == 'encode' else 'application/octet-stream'
+            headers['Content-Type'] = content_type
+            if operation == 'encode':
+                headers['Content-Disposition'] = f'attachment; filename="stego{CODECS[codec].output_extension}"'
+        return 200, headers, result
+
+async def send_response(writer, status, headers, body):
+    # Write the response a chunk at a time, waiting for the client to keep up (drain) so a
+    # slow reader never makes the server buffer a whole video
+    kind = body[0]
+    if kind == 'json':
+        data = json.dumps(body[1]).encode('utf-8')
+        headers = {'Content-Type': 'application/json', **headers}
+        length = len(data)
+    elif kind == 'data':
+        data = body[1]
+        length = len(data)
+    else:
+        length = os.path.getsize(body[1])
+    head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", f"Content-Length: {length}", "Connection: close"]
+    head += [f"{name}: {value}" for name, value in headers.items()]
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+
+    if kind == 'file':
+        with open(body[1], 'rb') as file:
+            while True:
+                chunk = file.read(RESPONSE_CHUNK)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+    else:
+        view = memoryview(data)
+        for start in range(0, length, RESPONSE_CHUNK):
+            writer.write(view[start:start + RESPONSE_CHUNK])
+            await writer.drain()
+    await writer.drain()
+
+async def serve(server, host='127.0.0.1', port=DEFAULT_PORT, socket_path=None):
+    server.slots = asyncio.Semaphore(server.workers)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, server.start_pool)
+    if socket_path:
+        listener = await asyncio.start_unix_server(server.handle_connection, socket_path)
+        logger.warning("Serving on %s with %d workers", socket_path, server.workers)
+    else:
+        listener = await asyncio.start_server(server.handle_connection, host, port)
+        logger.warning("Serving on http://%s:%d with %d workers", host, port, server.workers)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve encode, decode and capacity requests over local HTTP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--socket', help="Listen on this Unix socket instead of TCP")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Size of the process pool")
+    parser.add_argument('--max-pending', type=int, help="Jobs allowed to wait for a worker (default: 4 per worker)")
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help="Seconds a job may run")
+    parser.add_argument('--max-body-mb', type=int, default=DEFAULT_MAX_BODY >> 20, help="Largest request body")
+    parser.add_argument('--cache-dir', help="Keep decode results here and reuse them for repeated uploads")
+    parser.add_argument('--cache-mb', type=int, default=DEFAULT_CACHE_BYTES >> 20, help="Size cap of --cache-dir")
+    parser.add_argument('--log-level', default='WARNING', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level, stream=sys.stderr, format='%(levelname)s %(name)s: %(message)s')
+
+    cache = (args.cache_dir, args.cache_mb << 20) if args.cache_dir else None
+    server = JobServer(max(1, args.workers), args.max_pending, args.timeout, args.max_body_mb << 20, cache)
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+import os
+import pytest
+from text_steganography import text_capacity, encode_text, encode_text_buffer, decode_text_bytes
+
+# text_capacity is exactly the largest payload the encoder takes: one hidden bit per cover
+# character, including multi-byte UTF-8 characters and the cover's own whitespace.
+
+COVERS = [
+    "The quick brown fox jumps over the lazy dog.\n" * 40,
+    "Grüße aus Zürich — naïve café ☕\tand tabs\n" * 30,
+]
+
+@pytest.mark.parametrize('cover_text', COVERS)
+def test_payload_of_exactly_text_capacity_encodes(tmp_path, cover_text):
+    cover = tmp_path / 'cover.txt'
+    cover.write_text(cover_text, encoding='utf-8', newline='')
+    payload = os.urandom(text_capacity(str(cover)) // 8)
+    payload_path = tmp_path / 'payload.bin'
+    payload_path.write_bytes(payload)
+
+    output = encode_text(str(cover), str(payload_path), str(tmp_path / 'stego.txt'))
+    assert decode_text_bytes(output) == payload
+    assert decode_text_bytes(encode_text_buffer(cover.read_bytes(), payload)) == payload
+
+@pytest.mark.parametrize('cover_text', COVERS)
+def test_payload_one_byte_over_text_capacity_is_rejected(tmp_path, cover_text):
+    cover = tmp_path / 'cover.txt'
+    cover.write_text(cover_text, encoding='utf-8', newline='')
+    payload = os.urandom(text_capacity(str(cover)) // 8 + 1)
+    payload_path = tmp_path / 'payload.bin'
+    payload_path.write_bytes(payload)
+
+    with pytest.raises(ValueError):
+        encode_text(str(cover), str(payload_path), str(tmp_path / 'stego.txt'))
+    with pytest.raises(ValueError):
+        encode_text_buffer(cover.read_bytes(), payload)
+    assert sorted(os.listdir(tmp_path)) == ['cover.txt', 'payload.bin']
+
+def test_encoding_onto_the_cover_keeps_it_until_done(tmp_path):
+    cover = tmp_path / 'cover.txt'
+    cover.write_text(COVERS[1], encoding='utf-8', newline='')
+    payload = b'hidden'
+
+    encode_text(str(cover), payload, str(cover))
+    assert decode_text_bytes(str(cover)) == payload
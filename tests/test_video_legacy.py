@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from PIL import Image
+from video_steganography import lsb_decode, EOF_MARKER
+
+# Frames written by the video encoder before the payload container existed must keep
+# decoding: the message bits followed by EOF_MARKER, in the red channel, visiting the
+# pixels column by column (the old pixels[i, j] loop over x, then y).
+
+def legacy_lsb_encode(frame, lsb_bits, text):
+    # The original per-pixel encoder, on a BGR frame, in place
+    image = Image.fromarray(np.ascontiguousarray(frame[..., ::-1]))
+    pixels = image.load()
+    binary_message = ''.join(format(ord(char), '08b') for char in text + EOF_MARKER)
+
+    data_index = 0
+    total_bits = len(binary_message)
+    width, height = image.size
+    for i in range(width):
+        for j in range(height):
+            if data_index < total_bits:
+                r, g, b = pixels[i, j]
+                r_bin = format(r, '08b')
+                bits_to_embed = binary_message[data_index:data_index + lsb_bits].ljust(lsb_bits, '0')
+                r_bin = r_bin[:-lsb_bits] + bits_to_embed
+                pixels[i, j] = (int(r_bin, 2), g, b)
+                data_index += lsb_bits
+            if data_index >= total_bits:
+                break
+        if data_index >= total_bits:
+            break
+
+    frame[..., 2] = np.asarray(image)[..., 0]
+    return frame
+
+@pytest.mark.parametrize('lsb_bits', [1, 2, 3, 5, 7, 8])
+@pytest.mark.parametrize('text', ["Hello, stego world!", "x" * 300])
+def test_legacy_frames_decode(lsb_bits, text):
+    rng = np.random.default_rng(lsb_bits)
+    frame = rng.integers(0, 256, size=(48, 64, 3), dtype=np.uint8)
+    legacy_lsb_encode(frame, lsb_bits, text)
+    assert lsb_decode(frame, lsb_bits) == text
+
+def test_legacy_frame_with_unused_tail_decodes():
+    # A short message leaves most of the frame untouched; the decoder must stop at the marker
+    frame = np.full((120, 160, 3), 0xFF, dtype=np.uint8)
+    legacy_lsb_encode(frame, 1, "short")
+    assert lsb_decode(frame, 1) == "short"
@@ -0,0 +1,226 @@
+import contextlib
+import io
+import os
+import re
+import numpy as np
+from payload import PayloadSource, parse_header, open_payload, payload_to_text, usable_bits, HEADER
+from progress import report
+from instrumentation import timed, phase
+from decode_cache import cached_decode
+from buffers import as_file, is_path, source_size, replacing
+
+# Whitespace steganography for text covers. A hidden bit follows each cover character:
+# a tab for 1, a space for 0, so the cover must have a character for every bit. (Older
+# encoders appended the bits left over once the cover ran out at the end; the decoder
+# still reads those files.) The payload is stored in the shared container, so the decoder
+# knows exactly how many bits to read and where they are; cover whitespace is never
+# mistaken for payload.
+#
+# Files are read and written as UTF-8 with newline translation turned off, since
+# translating '\n' to '\r\n' would shift every position after it. Bytes that are not
+# valid UTF-8 pass through unchanged (surrogateescape), so any text encoding works as a cover.
+TEXT_OPTIONS = {'encoding': 'utf-8', 'errors': 'surrogateescape', 'newline': ''}
+
+ONE = '\t'
+ZERO = ' '
+
+# Number of characters read or written per step
+CHUNK_CHARS = 1 << 20
+
+# bytes.translate tables between unpacked bits (0/1 bytes) and whitespace characters
+BITS_TO_WHITESPACE = bytes.maketrans(b'\x00\x01', ZERO.encode() + ONE.encode())
+
+HEADER_BITS = HEADER.size * 8
+
+def bits_to_whitespace(bits):
+    # A 0/1 array as tabs and spaces
+    return bits.tobytes().translate(BITS_TO_WHITESPACE).decode('ascii')
+
+def whitespace_to_payload(whitespace):
+    # Tabs and spaces back to bytes, most significant bit first; None if a character is
+    # not a tab or a space
+    codes = np.frombuffer(whitespace.encode('utf-8', 'surrogateescape'), dtype=np.uint8)
+    if len(codes) != len(whitespace) or not np.all((codes == ord(ONE)) | (codes == ord(ZERO))):
+        return None
+    bits = (codes == ord(ONE)).astype(np.uint8)
+    return np.packbits(bits[:len(bits) - len(bits) % 8]).tobytes()
+
+def interleave(cover_text, bits):
+    # cover[0] bits[0] cover[1] bits[1] ... built with one join instead of repeated +=
+    count = min(len(cover_text), len(bits))
+    pieces = [None] * (2 * count)
+    pieces[0::2] = cover_text[:count]
+    pieces[1::2] = bits[:count]
+    return ''.join(pieces)
+
+def read_header(stego_text):
+    # The header is the first HEADER_BITS hidden bits. They sit after the first
+    # HEADER_BITS cover characters unless the cover was shorter than that, in which case
+    # they continue at the end; try each possible short cover length in turn.
+    for cover_length in [HEADER_BITS] + list(range(HEADER_BITS)):
+        if cover_length == HEADER_BITS:
+            bits = stego_text[1:2 * HEADER_BITS:2]
+        else:
+            bits = stego_text[1:2 * cover_length:2] + stego_text[2 * cover_length:cover_length + HEADER_BITS]
+        header_bytes = whitespace_to_payload(bits) if len(bits) == HEADER_BITS else None
+        header = parse_header(header_bytes) if header_bytes else None
+        if header is None:
+            continue
+        total_bits = (HEADER.size + header[1]) * 8
+        if cover_length == HEADER_BITS and len(stego_text) - total_bits >= HEADER_BITS:
+            return header
+        if len(stego_text) - total_bits == cover_length:
+            return header
+    return None
+
+def reveal_from_text(stego_text):
+    # Returns the payload bytes, or None if the text does not hold a container
+    header = read_header(stego_text)
+    if header is None:
+        return None
+    _, length, _ = header
+    total_bits = (HEADER.size + length) * 8
+    cover_length = len(stego_text) - total_bits
+    count = min(cover_length, total_bits)
+    bits = stego_text[1:2 * count:2] + stego_text[2 * count:]
+    data = whitespace_to_payload(bits[:total_bits])
+    if data is None:
+        return None
+    return open_payload(header, data[HEADER.size:])
+
+def legacy_reveal_from_text(stego_text):
+    # Text encoded before the container format: every tab and space in the file is a bit
+    # (7 bits per character), including whitespace that was already in the cover
+    whitespace = re.sub(r'[^\t ]+', '', stego_text)
+    bits = np.frombuffer(whitespace.encode('ascii'), dtype=np.uint8) == ord(ONE)
+    groups = bits[:len(bits) - len(bits) % 7].reshape(-1, 7)
+    values = groups.astype(np.uint8) @ (1 << np.arange(6, -1, -1)).astype(np.uint8)
+    return values.astype(np.uint8).tobytes()
+
+@contextlib.contextmanager
+def open_text(source, mode='r'):
+    # A text stream with TEXT_OPTIONS over a path, bytes or a binary file object. A file
+    # object is left open afterwards, so the caller can read back what was written.
+    if is_path(source):
+        with open(source, mode, **TEXT_OPTIONS) as file:
+            yield file
+        return
+    file = io.TextIOWrapper(as_file(source), **TEXT_OPTIONS)
+    try:
+        yield file
+    finally:
+        file.flush()
+        file.detach()
+
+def write_stego_text(cover_file, payload, output_file, progress=None, compression=None, cover_size=None):
+    # The encoder shared by encode_text and encode_text_buffer, between two text streams.
+    # Stream the cover through a block of characters at a time, taking the matching block
+    # of payload bits as whitespace, so neither is held in memory as a whole.
+    with phase('load'):
+        payload = PayloadSource(payload, compression)
+    start = cover_file.buffer.tell()
+    with payload:
+        total_bits = len(payload) * 8
+        # A character takes at least a byte, so a cover with fewer bytes than bits is too small
+        if cover_size is not None and cover_size < total_bits:
+            raise ValueError("Payload too large for the selected text cover object.")
+        stream = payload.groups(1)
+        cover_chars = 0
+        while True:
+            report(progress, cover_file.buffer.tell() - start, cover_size)
+            with phase('load'):
+                chunk = cover_file.read(CHUNK_CHARS)
+            if not chunk:
+                break
+            cover_chars += len(chunk)
+            bits = bits_to_whitespace(stream.take(len(chunk)))
+            with phase('embed'):
+                stego_chunk = interleave(chunk, bits)
+            with phase('save'):
+                output_file.write(stego_chunk)
+                output_file.write(chunk[len(bits):])
+        if cover_chars < total_bits:
+            raise ValueError("Payload too large for the selected text cover object.")
+    report(progress, cover_size, cover_size)
+
+@timed('text', 'encode')
+def encode_text_buffer(cover, payload, progress=None, compression=None):
+    # encode_text without the disk: the cover is a path, the cover file's bytes or a binary
+    # file object, and the stego text file comes back as bytes
+    output = io.BytesIO()
+    cover_size = source_size(cover)
+    with open_text(cover) as cover_file, open_text(output, 'w') as output_file:
+        write_stego_text(cover_file, payload, output_file, progress, compression, cover_size)
+    return output.getvalue()
+
+@timed('text', 'encode')
+def encode_text(cover_path, payload_path, output_path, progress=None, compression=None):
+    cover_size = os.path.getsize(cover_path)
+    # Written next to the output and moved into place at the end, so a payload that turns out
+    # not to fit leaves nothing behind and the output may be the cover itself
+    with replacing(output_path) as temporary_path:
+        with open_text(cover_path) as cover_file, open_text(temporary_path, 'w') as output_file:
+            write_stego_text(cover_file, payload_path, output_file, progress, compression, cover_size)
+    return output_path
+
+def interleaved_header(stego_text):
+    # The header from every other character at the start of the text, as written when the
+    # cover has at least HEADER_BITS characters; None if there is no header there
+    header_bytes = whitespace_to_payload(stego_text[1:2 * HEADER_BITS:2])
+    return parse_header(header_bytes) if header_bytes and len(header_bytes) == HEADER.size else None
+
+@timed('text', 'decode')
+@cached_decode
+def decode_text_bytes(stego, progress=None):
+    # The payload hidden in a text file given as a path, its bytes or a binary file object.
+    # The text is read a block of characters at a time. When the cover was at least as long
+    # as the hidden bits (the usual case) they all sit in the first 2 * total bits
+    # characters, so reading stops there; shorter covers, which put the leftover bits at
+    # the very end, and the legacy format are decoded from the whole text.
+    size = source_size(stego)
+    with open_text(stego) as stego_file:
+        start = stego_file.buffer.tell()
+        with phase('load'):
+            chunks = [stego_file.read(CHUNK_CHARS)]
+        header = interleaved_header(chunks[0])
+        interleaved_chars = 2 * (HEADER.size + header[1]) * 8 if header else None
+        read_chars = len(chunks[0])
+        while chunks[-1]:
+            if interleaved_chars is not None and read_chars >= interleaved_chars:
+                # Every hidden bit has been read; decode them, or read on if they are not
+                # all whitespace after all
+                with phase('unpack'):
+                    data = whitespace_to_payload(''.join(chunks)[1:interleaved_chars:2])
+                    if data is not None:
+                        payload = open_payload(header, data[HEADER.size:])
+                        report(progress, size, size)
+                        return payload
+                interleaved_chars = None
+            report(progress, stego_file.buffer.tell() - start, size)
+            with phase('load'):
+                chunks.append(stego_file.read(CHUNK_CHARS))
+            read_chars += len(chunks[-1])
+
+    stego_text = ''.join(chunks)
+    with phase('unpack'):
+        payload = reveal_from_text(stego_text)
+        if payload is None:
+            payload = legacy_reveal_from_text(stego_text)
+    report(progress, size, size)
+    return payload
+
+def decode_text(stego, progress=None):
+    return payload_to_text(decode_text_bytes(stego, progress))
+
+def text_capacity(cover):
+    # One hidden bit per cover character, exactly what write_stego_text accepts. A text
+    # cover has no header to read the length from, so the characters are counted a block at
+    # a time as the encoder would read them (a multi-byte UTF-8 character counts once).
+    characters = 0
+    with open_text(cover) as cover_file:
+        while True:
+            chunk = cover_file.read(CHUNK_CHARS)
+            if not chunk:
+                break
+            characters += len(chunk)
+    return usable_bits(characters, 1)
@@ -1,168 +1,473 @@
+import itertools
 import math
 import cv2
 import os
-from PIL import Image
-from moviepy.editor import VideoFileClip, ImageSequenceClip
+import struct
+import subprocess
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import imageio_ffmpeg
+import numpy as np
+from lsb_utils import validate_lsb_count, text_to_bytes, bytes_to_bits, groups_to_bits, embed_groups, group_count, BitReader, GroupStream
+from payload import PayloadSource, unpack_stream, payload_to_text, usable_bits, PayloadError
+from progress import report
+from instrumentation import timed, phase, add_phase_time
+from decode_cache import cached_decode
+from scatter import carrier_permutation, leading_positions, scatter_groups, gather_groups, iter_scattered_bytes
 
+# End marker of the text-only format used before the payload container
 EOF_MARKER = "$$$###$$$"
 
-# Get the directory of the current file 
-CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Number of red values unpacked per step while decoding a frame
+DECODE_CHUNK_VALUES = 1 << 18
 
-# Set BASE_DIR to the parent directory of 'steno/', which is the project root
-BASE_DIR = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+# Header written at the start of the first frame of a multi-frame (spread) payload:
+# magic, lsb bits, channel count, first frame, frame count, values per frame, container length
+SPREAD_MAGIC = b'VSPR'
+SPREAD_HEADER = struct.Struct('>4sBBIIIQ')
 
-# Define the frames directory in the project root
-FRAMES_DIR = os.path.join(BASE_DIR, 'frames')
+# Channel order used by spread mode: R, then G, then B (cv2 frames are BGR)
+SPREAD_CHANNEL_ORDER = [2, 1, 0]
 
-def extract_frames(video_path, output_folder=FRAMES_DIR):
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-    
-    cap = cv2.VideoCapture(video_path)
+def lsb_encode(frame, lsb_bits, data_file, key=None, compression=None):
+    # Embed the data (a path, bytes or a binary file object) into the red channel of a BGR
+    # frame (as read by cv2), in place. With lsb_decode_bytes this is the in-memory API for
+    # video: OpenCV and ffmpeg only open video containers from paths.
+    # Traversal order is column-major, lsb_bits per red value: down the first column from
+    # the top, then down the second column, and so on. This is the order of the original
+    # PIL pixels[x, y] loop, so videos written before the NumPy version still decode.
+    # With a key the red values are visited along the key's permutation instead.
+    validate_lsb_count(lsb_bits)
+    with phase('load'):
+        payload = PayloadSource(data_file, compression)
+    with payload:
+        height, width = frame.shape[:2]
+        count = group_count(len(payload), lsb_bits)
+        if count > width * height:
+            raise ValueError("The message is too long to be encoded in the frame.")
+
+        if key is not None:
+            red = np.ascontiguousarray(frame[..., 2]).reshape(-1)
+            permutation = carrier_permutation(key, red.shape)
+            offset = 0
+            for groups in payload.groups(lsb_bits):
+                with phase('embed'):
+                    scatter_groups(red, groups, lsb_bits, permutation, offset)
+                offset += len(groups)
+            frame[..., 2] = red.reshape(height, width)
+            return frame
+
+        # Transposing the red plane makes the column-major order a plain reshape; only the
+        # columns that carry the message are copied out and written back
+        columns = math.ceil(count / height)
+        red_columns = frame[:, :columns, 2].T
+        carrier = red_columns.reshape(-1)
+        offset = 0
+        for groups in payload.groups(lsb_bits):
+            with phase('embed'):
+                embed_groups(carrier, groups, lsb_bits, offset)
+            offset += len(groups)
+        red_columns[...] = carrier.reshape(red_columns.shape)
+    return frame
+
+def video_properties(video_file):
+    # (width, height, fps, frame count) from the container metadata, without decoding a frame
+    cap = cv2.VideoCapture(video_file)
     if not cap.isOpened():
         raise IOError("Error: Could not open video.")
-    
-    frame_count = 0
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        frame_filename = os.path.join(output_folder, f"frame_{frame_count}.png")
-        cv2.imwrite(frame_filename, frame)
-        frame_count += 1
-    
-    cap.release()
-
-def generate_data(data_file):
-    with open(data_file, 'r', encoding='utf8') as file:
-        text = file.read()
-
-    binary_string = ''.join(format(ord(char), '08b') for char in text)
-    binary_eof_marker = ''.join(format(ord(char), '08b') for char in EOF_MARKER)
-    return binary_string + binary_eof_marker
-
-def lsb_encode(frame_number, lsb_bits, data_file, frames_folder=FRAMES_DIR):
-    spec_frame = os.path.join(frames_folder, f'frame_{frame_number}.png')
-    if not os.path.exists(spec_frame):
-        raise FileNotFoundError(f"Frame {spec_frame} not found.")
-    
-    image = Image.open(spec_frame)
-    pixels = image.load()
-    binary_message = generate_data(data_file)
-    
-    data_index = 0
-    total_bits = len(binary_message)
-    width, height = image.size
-    
-    for i in range(width):
-        for j in range(height):
-            if data_index < total_bits:
-                r, g, b = pixels[i, j]
-                r_bin = format(r, '08b')
-                bits_to_embed = binary_message[data_index:data_index + lsb_bits]
-                bits_to_embed = bits_to_embed.ljust(lsb_bits, '0')
-                r_bin = r_bin[:-lsb_bits] + bits_to_embed
-                pixels[i, j] = (int(r_bin, 2), g, b)
-                data_index += lsb_bits
-            if data_index >= total_bits:
-                break
-        if data_index >= total_bits:
-            break
-    
-    image.save(spec_frame)
-
-def create_video_with_audio(audio_path, output_video, fps, frames_folder=FRAMES_DIR):
-    frame_files = [
-        os.path.join(frames_folder, f)
-        for f in sorted(
-            os.listdir(frames_folder),
-            key=lambda x: int(x.split('_')[1].split('.')[0])
-        )
+    try:
+        return (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                cap.get(cv2.CAP_PROP_FPS), int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    finally:
+        cap.release()
+
+def video_capacity(video_file, lsb_bits=1, mode='frame', start_frame=0, end_frame=None, channels=3):
+    # Usable payload bits. 'frame' mode uses the red channel of one frame (encode_video);
+    # 'spread' mode uses `channels` channels of every frame in [start_frame, end_frame)
+    validate_lsb_count(lsb_bits)
+    width, height, _, frame_count = video_properties(video_file)
+    if mode == 'frame':
+        return usable_bits(width * height, lsb_bits)
+    if mode == 'spread':
+        validate_channels(channels)
+        if end_frame is None:
+            end_frame = frame_count
+        frames = max(0, min(end_frame, frame_count) - start_frame)
+        return usable_bits(frames * width * height * channels, lsb_bits, SPREAD_HEADER.size)
+    raise ValueError(f"Unknown video mode: {mode}")
+
+def open_video_writer(output_video, width, height, fps, audio_source):
+    # Start an ffmpeg process that encodes raw BGR frames from its stdin with the lossless
+    # FFV1 codec, copying the audio stream (if any) of audio_source without re-encoding it
+    cmd = [
+        imageio_ffmpeg.get_ffmpeg_exe(),
+        '-y',
+        '-loglevel', 'error',
+        '-f', 'rawvideo',
+        '-vcodec', 'rawvideo',
+        '-s', f'{width}x{height}',
+        '-pix_fmt', 'bgr24',
+        '-r', str(fps),
+        '-i', '-',
+        '-i', audio_source,
+        '-map', '0:v:0',
+        '-map', '1:a?',
+        '-vcodec', 'ffv1',
+        '-acodec', 'copy',
+        output_video,
     ]
-    clip = ImageSequenceClip(frame_files, fps=fps)
-    video = VideoFileClip(audio_path)
-    final_video = clip.set_audio(video.audio)
-    output_video = output_video.rsplit('.', 1)[0] + '.avi'
-    final_video.write_videofile(output_video, codec='ffv1')
-    final_video.close()
-    clip.close()
-    video.close()
-
-def clear_output_directory(output_folder=FRAMES_DIR):
-    if os.path.exists(output_folder):
-        for filename in os.listdir(output_folder):
-            file_path = os.path.join(output_folder, filename)
-            if os.path.isfile(file_path):
-                os.remove(file_path)
-    else:
-        os.makedirs(output_folder)
+    return subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
 
-def encode_video(video_file, data_file, frame_number, lsb_bits, output_video, frames_folder=FRAMES_DIR):
-    if not os.path.exists(frames_folder):
-        os.makedirs(frames_folder)
-    clear_output_directory(frames_folder)
-    extract_frames(video_file, frames_folder)
+def close_video_writer(writer):
+    try:
+        writer.stdin.close()
+    except BrokenPipeError:
+        pass
+    error_output = writer.stderr.read()
+    if writer.wait() != 0:
+        raise IOError(f"Error: ffmpeg failed to write the video: {error_output.decode(errors='replace').strip()}")
+
+@timed('video', 'encode')
+def encode_video(video_file, data_file, frame_number, lsb_bits, output_video, progress=None, key=None, compression=None):
     cap = cv2.VideoCapture(video_file)
+    if not cap.isOpened():
+        raise IOError("Error: Could not open video.")
     fps = cap.get(cv2.CAP_PROP_FPS)
-    cap.release()
-    lsb_encode(frame_number, lsb_bits, data_file, frames_folder)
-    # Corrected the order of arguments in the function call below
-    create_video_with_audio(video_file, output_video, fps, frames_folder)
-    clear_output_directory(frames_folder)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    output_video = output_video.rsplit('.', 1)[0] + '.avi'
+
+    # Decode the cover once and pipe every frame straight into the encoder,
+    # embedding into the target frame on the way through
+    writer = open_video_writer(output_video, width, height, fps, video_file)
+    embedded = False
+    try:
+        current_frame = 0
+        while True:
+            report(progress, current_frame, frame_count)
+            with phase('extract'):
+                ret, frame = cap.read()
+            if not ret:
+                break
+            if current_frame == frame_number:
+                lsb_encode(frame, lsb_bits, data_file, key, compression)
+                embedded = True
+            try:
+                with phase('remux'):
+                    writer.stdin.write(frame.tobytes())
+            except BrokenPipeError:
+                break  # ffmpeg has exited, its error is reported by close_video_writer
+            current_frame += 1
+        with phase('remux'):
+            close_video_writer(writer)
+        if not embedded:
+            raise ValueError(f"Frame {frame_number} not found.")
+    except BaseException:
+        # Cancelled, failed or ffmpeg could not finish: don't leave a partial video behind
+        writer.kill()
+        writer.wait()
+        if os.path.exists(output_video):
+            os.remove(output_video)
+        raise
+    finally:
+        cap.release()
+    return output_video
 
 ################################### DECODE SECTION #######################################
 
-def lsb_decode(frame_number, lsb_bits, frames_folder=FRAMES_DIR):
-    # Open the image
-    img_path = os.path.join(frames_folder, f'frame_{frame_number}.png')
-    if not os.path.exists(img_path):
-        raise FileNotFoundError(f"Frame image not found: {img_path}")
-    
-    image = Image.open(img_path)
-    pixels = image.load()
-    
-    binary_message = ''
-    width, height = image.size
-
-    for i in range(width):
-        for j in range(height):
-            r, g, b = pixels[i, j]
-            # Extract LSBs from red channel
-            r_bin = format(r, '08b')
-            binary_message += r_bin[-lsb_bits:]
-    
-    # Convert binary data to text
-    decoded_message = ''
-    binary_eof_marker = ''.join(format(ord(char), '08b') for char in EOF_MARKER)
-    eof_index = binary_message.find(binary_eof_marker)
-    
-    if eof_index != -1:
-        binary_message = binary_message[:eof_index]
-    else:
+def iter_red_columns(frame, columns_per_chunk):
+    # Red values in the column-major order used by lsb_encode, a block of columns at a time
+    red = frame[..., 2]
+    for column in range(0, red.shape[1], columns_per_chunk):
+        yield red[:, column:column + columns_per_chunk].T.reshape(-1)
+
+def lsb_decode_bytes(frame, lsb_bits, key=None):
+    # Read the payload back out of the red channel of a BGR frame (as read by cv2), in the
+    # column-major order used by lsb_encode
+    validate_lsb_count(lsb_bits)
+    if key is not None:
+        # Keyed frames always hold a container, read along the key's permutation
+        red = np.ascontiguousarray(frame[..., 2]).reshape(-1)
+        permutation = carrier_permutation(key, red.shape)
+        payload = unpack_stream(iter_scattered_bytes(red, lsb_bits, permutation, DECODE_CHUNK_VALUES))
+        if payload is None:
+            raise PayloadError("No payload found with this key.")
+        return payload
+
+    columns_per_chunk = max(1, DECODE_CHUNK_VALUES // frame.shape[0])
+    reader = BitReader(lsb_bits)
+    payload = unpack_stream(reader.feed(values) for values in iter_red_columns(frame, columns_per_chunk))
+    if payload is None:
+        payload = legacy_lsb_decode(frame, lsb_bits, columns_per_chunk)
+    return payload
+
+def legacy_lsb_decode(frame, lsb_bits, columns_per_chunk):
+    # Frames encoded before the container format end with EOF_MARKER, which may start at
+    # any bit offset, so the search runs over the unpacked bits a block of columns at a time
+    binary_eof_marker = bytes_to_bits(text_to_bytes(EOF_MARKER)).tobytes()
+    binary_message = bytearray()
+    for values in iter_red_columns(frame, columns_per_chunk):
+        search_from = max(0, len(binary_message) - len(binary_eof_marker) + 1)
+        binary_message += groups_to_bits(values, lsb_bits).tobytes()
+        eof_index = binary_message.find(binary_eof_marker, search_from)
+        if eof_index != -1:
+            del binary_message[eof_index:]
+            break
         # If EOF marker not found, decode all available data
-        pass
-    
-    # Split into 8-bit chunks and convert to characters
-    for i in range(0, len(binary_message), 8):
-        byte = binary_message[i:i+8]
-        if len(byte) < 8:
-            continue  # Skip incomplete byte
-        decoded_char = chr(int(byte, 2))
-        decoded_message += decoded_char
-    
-    return decoded_message
-
-def decode_video(video_file, frame_number, lsb_bits, frames_folder=FRAMES_DIR):
-    clear_output_directory(frames_folder)
-
-    # Extract frames
-    extract_frames(video_file, frames_folder)
-    
-    # Decode the message
-    decoded_data = lsb_decode(frame_number, lsb_bits, frames_folder)
-    
-    # Clean up and return
-    clear_output_directory(frames_folder)
-    return decoded_data
+
+    # Pack into 8-bit chunks, skipping an incomplete last byte
+    bits = np.frombuffer(binary_message, dtype=np.uint8)
+    bits = bits[:len(bits) - len(bits) % 8]
+    return np.packbits(bits).tobytes()
+
+def lsb_decode(frame, lsb_bits, key=None):
+    return payload_to_text(lsb_decode_bytes(frame, lsb_bits, key))
+
+def open_capture_at(video_file, frame_number, progress=None):
+    # Open the video positioned on frame_number. The frames before it are only grabbed
+    # (not converted to BGR); CAP_PROP_POS_FRAMES seeking is not used because OpenCV can
+    # land a frame early on AVI files, which would corrupt the payload
+    cap = cv2.VideoCapture(video_file)
+    if not cap.isOpened():
+        raise IOError("Error: Could not open video.")
+    try:
+        for current_frame in range(frame_number):
+            report(progress, current_frame, frame_number + 1)
+            if not cap.grab():
+                break
+    except BaseException:
+        cap.release()
+        raise
+    return cap
+
+def read_frame(video_file, frame_number, progress=None):
+    # Decode a single frame, stopping as soon as it has been read
+    cap = open_capture_at(video_file, frame_number, progress)
+    try:
+        ret, frame = cap.read()
+    finally:
+        cap.release()
+    if not ret:
+        raise ValueError(f"Frame {frame_number} not found.")
+    report(progress, frame_number + 1, frame_number + 1)
+    return frame
+
+@timed('video', 'decode')
+@cached_decode
+def decode_video_bytes(video_file, frame_number, lsb_bits, progress=None, key=None):
+    # Decode the payload from the requested frame only, in memory
+    with phase('extract'):
+        frame = read_frame(video_file, frame_number, progress)
+    with phase('unpack'):
+        return lsb_decode_bytes(frame, lsb_bits, key)
+
+def decode_video(video_file, frame_number, lsb_bits, progress=None, key=None):
+    return payload_to_text(decode_video_bytes(video_file, frame_number, lsb_bits, progress, key))
+
+################################### MULTI-FRAME SECTION ##################################
+
+def validate_channels(channels):
+    if channels < 1 or channels > 3:
+        raise ValueError("Channel count must be between 1 (red only) and 3 (red, green, blue).")
+
+def spread_plane(frame, channels):
+    # The carrier values of a frame in spread mode: row-major over pixels, then R, G, B
+    return frame[..., SPREAD_CHANNEL_ORDER[:channels]].reshape(-1)
+
+def embed_spread_frame(frame, groups, lsb_bits, channels, key=None):
+    # Runs on the worker pool: embed this frame's share of the payload and return the frame.
+    # Keyed frames all use the same positions, which each worker computes once and caches.
+    plane = spread_plane(frame, channels)
+    if key is None:
+        embed_groups(plane, groups, lsb_bits)
+    else:
+        scatter_groups(plane, groups, lsb_bits, leading_positions(key, plane.shape, len(groups)))
+    frame[..., SPREAD_CHANNEL_ORDER[:channels]] = plane.reshape(frame.shape[0], frame.shape[1], channels)
+    return frame
+
+def extract_spread_frame(frame, count, lsb_bits, channels, key=None):
+    # Runs on the worker pool: return the low bits of the first count carrier values
+    plane = spread_plane(frame, channels)
+    if key is not None:
+        return gather_groups(plane, count, lsb_bits, leading_positions(key, plane.shape, count))
+    return plane[:count] & np.uint8((1 << lsb_bits) - 1)
+
+def run_timed(func, *args):
+    # Runs on the worker pool, where there is no Timer: func's result and the seconds it took
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def run_ordered(executor, items, max_in_flight):
+    # Yield the results of (phase, func, args) items in order, or plain values as they are,
+    # keeping at most max_in_flight items queued so frames never pile up in memory. The time
+    # each job took is added to the caller's Timer as that phase.
+    queue = deque()
+
+    def finish(entry):
+        name, value = entry
+        if name is None:
+            return value
+        result, seconds = value.result() if isinstance(value, Future) else value
+        add_phase_time(name, seconds)
+        return result
+
+    for item in items:
+        if isinstance(item, tuple):
+            name, func, args = item
+            queue.append((name, executor.submit(run_timed, func, *args) if executor else run_timed(func, *args)))
+        else:
+            queue.append((None, item))
+        while len(queue) > max_in_flight:
+            yield finish(queue.popleft())
+    while queue:
+        yield finish(queue.popleft())
+
+@timed('video', 'encode')
+def encode_video_spread(video_file, data_file, lsb_bits, output_video, start_frame=0, end_frame=None, channels=3, workers=None, progress=None, key=None, compression=None):
+    # Spread the payload evenly over frames [start_frame, end_frame) (every frame from
+    # start_frame by default), using up to three channels per pixel. Frames are embedded
+    # on a process pool while the cover streams through to the FFV1 writer.
+    validate_lsb_count(lsb_bits)
+    validate_channels(channels)
+
+    cap = cv2.VideoCapture(video_file)
+    if not cap.isOpened():
+        raise IOError("Error: Could not open video.")
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    video_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if end_frame is None:
+        end_frame = video_frames
+    range_frames = end_frame - start_frame
+    if start_frame < 0 or range_frames < 1:
+        cap.release()
+        raise ValueError("The frame range is empty.")
+
+    try:
+        with phase('load'):
+            payload = PayloadSource(data_file, compression)
+    except BaseException:
+        cap.release()
+        raise
+
+    # Share the values out evenly, but keep the whole header in the first frame
+    values_per_frame = width * height * channels
+    header_values = group_count(SPREAD_HEADER.size, lsb_bits)
+    total_values = group_count(SPREAD_HEADER.size + len(payload), lsb_bits)
+    frame_values = max(math.ceil(total_values / range_frames), header_values)
+    if frame_values > values_per_frame:
+        cap.release()
+        payload.close()
+        raise ValueError("The message is too long to be encoded in the selected frames.")
+    frame_count = math.ceil(total_values / frame_values)
+
+    # Each frame's share is read from the payload file as the frame comes up
+    header = SPREAD_HEADER.pack(SPREAD_MAGIC, lsb_bits, channels, start_frame, frame_count, frame_values, len(payload))
+    stream = GroupStream(itertools.chain([header], payload.blocks()), lsb_bits)
+
+    def frame_jobs():
+        current_frame = 0
+        while True:
+            with phase('extract'):
+                ret, frame = cap.read()
+            if not ret:
+                break
+            index = current_frame - start_frame
+            if 0 <= index < frame_count:
+                share = stream.take(frame_values)
+                yield 'embed', embed_spread_frame, (frame, share, lsb_bits, channels, key)
+            else:
+                yield frame
+            current_frame += 1
+        if current_frame < start_frame + frame_count:
+            raise ValueError("The video has fewer frames than the payload needs.")
+
+    workers = workers or os.cpu_count()
+    output_video = output_video.rsplit('.', 1)[0] + '.avi'
+    writer = open_video_writer(output_video, width, height, fps, video_file)
+    executor = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        for frames_written, frame in enumerate(run_ordered(executor, frame_jobs(), 2 * workers)):
+            report(progress, frames_written, video_frames)
+            try:
+                with phase('remux'):
+                    writer.stdin.write(frame.tobytes())
+            except BrokenPipeError:
+                break  # ffmpeg has exited, its error is reported by close_video_writer
+        if executor:
+            # Workers forked after ffmpeg started hold its stdin open, so it would never see the end
+            executor.shutdown()
+        with phase('remux'):
+            close_video_writer(writer)
+    except BaseException:
+        # Cancelled, failed or ffmpeg could not finish: don't leave a partial video behind
+        writer.kill()
+        writer.wait()
+        if os.path.exists(output_video):
+            os.remove(output_video)
+        raise
+    finally:
+        cap.release()
+        payload.close()
+        if executor:
+            executor.shutdown(cancel_futures=True)
+    return output_video
+
+@timed('video', 'decode')
+@cached_decode
+def decode_video_spread_bytes(video_file, lsb_bits, channels=3, start_frame=0, workers=None, progress=None, key=None):
+    # Read a payload written by encode_video_spread. The header in start_frame says how many
+    # frames follow, so only those frames are decoded.
+    validate_lsb_count(lsb_bits)
+    validate_channels(channels)
+
+    with phase('extract'):
+        cap = open_capture_at(video_file, start_frame)
+    executor = None
+    try:
+        with phase('extract'):
+            ret, frame = cap.read()
+        if not ret:
+            raise ValueError(f"Frame {start_frame} not found.")
+
+        header_values = math.ceil(SPREAD_HEADER.size * 8 / lsb_bits)
+        with phase('unpack'):
+            header_bytes = BitReader(lsb_bits).feed(extract_spread_frame(frame, header_values, lsb_bits, channels, key))
+        magic, _, _, first_frame, frame_count, frame_values, payload_length = SPREAD_HEADER.unpack(
+            header_bytes[:SPREAD_HEADER.size])
+        if magic != SPREAD_MAGIC or first_frame != start_frame:
+            raise ValueError("No multi-frame payload found with these settings.")
+
+        def frame_jobs():
+            yield 'unpack', extract_spread_frame, (frame, frame_values, lsb_bits, channels, key)
+            for _ in range(frame_count - 1):
+                with phase('extract'):
+                    ret, next_frame = cap.read()
+                if not ret:
+                    raise ValueError("The video ended before the whole payload was read.")
+                yield 'unpack', extract_spread_frame, (next_frame, frame_values, lsb_bits, channels, key)
+
+        workers = workers or os.cpu_count()
+        executor = ProcessPoolExecutor(workers) if workers > 1 and frame_count > 1 else None
+        reader = BitReader(lsb_bits)
+        decoded = bytearray()
+        for frames_read, values in enumerate(run_ordered(executor, frame_jobs(), 2 * workers)):
+            report(progress, frames_read, frame_count)
+            with phase('unpack'):
+                decoded += reader.feed(values)
+    finally:
+        cap.release()
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+    payload = unpack_stream([decoded[SPREAD_HEADER.size:SPREAD_HEADER.size + payload_length]])
+    if payload is None:
+        raise PayloadError("The multi-frame payload is damaged.")
+    return payload
+
+def decode_video_spread(video_file, lsb_bits, channels=3, start_frame=0, workers=None, progress=None, key=None):
+    return payload_to_text(decode_video_spread_bytes(video_file, lsb_bits, channels, start_frame, workers, progress, key))